@@ -17,5 +17,8 @@
 #  Copyright: 2016, Ghent University
 
 from stream_reader import Stream_Reader
+from protobuf_util import Field_Filter
 from sd_file_util import SD_Hist_Reader
 from sd_file_util import SD_Hist_Writer
+from distance_hist import Distance_Hist, as_distance_hist
+from sample_columns import Column_Reader
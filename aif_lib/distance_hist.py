@@ -0,0 +1,195 @@
+#  This file is part of the program: Processor Modeling Tool (PMT).
+#
+#  PMT is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  PMT is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with PMT.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  Authors: Sam Van den Steen, Ghent University
+#  Copyright: 2016, Ghent University
+
+import sys, numpy
+
+# distances of at least this value are infinite (cold misses), the samples use sys.maxint for them
+INFINITE = sys.maxint
+
+# round non-negative keys down to their precision most significant bits, keys below 2**precision are kept exactly
+def bucket_keys(keys, precision):
+    if precision is None or len(keys) == 0:
+        return keys
+    bits, rest = numpy.zeros(len(keys), dtype = numpy.int64), keys.copy()
+    for shift in (32, 16, 8, 4, 2, 1):
+        large = rest >= (1 << shift)
+        bits[large] += shift
+        rest[large] >>= shift
+    bits += rest > 0
+    shifts = numpy.maximum(bits - precision, 0)
+    return (keys >> shifts) << shifts
+
+# Histogram of reuse or stack distances as sorted key and count arrays, infinite distances are counted separately
+# Keys are exact, or bucketed HDR histogram style to their precision most significant bits if a precision is given
+# Added distances are buffered and only merged into the arrays when the histogram is read
+class Distance_Hist(object):
+    def __init__(self, keys = None, counts = None, infinite = 0, precision = None):
+        self.precision = precision
+        self.sorted_keys = numpy.zeros(0, dtype = numpy.int64)
+        self.sorted_counts = numpy.zeros(0, dtype = numpy.int64)
+        self.infinite = int(infinite)
+        # single distances and arrays of distances that were added since the last read
+        self.pending_keys, self.pending_counts, self.pending_arrays = [], [], []
+        if keys is not None:
+            self.add_many(keys, counts)
+
+    def add(self, key, count = 1):
+        if key >= INFINITE:
+            self.infinite += count
+        else:
+            self.pending_keys.append(key)
+            self.pending_counts.append(count)
+
+    # add an array of distances, every distance counts once if counts is None
+    def add_many(self, keys, counts = None):
+        keys = numpy.asarray(keys, dtype = numpy.int64)
+        counts = numpy.ones(len(keys), dtype = numpy.int64) if counts is None else numpy.asarray(counts, dtype = numpy.int64)
+        infinite = keys >= INFINITE
+        if infinite.any():
+            self.infinite += int(counts[infinite].sum())
+            keys, counts = keys[~infinite], counts[~infinite]
+        if len(keys) > 0:
+            self.pending_arrays.append((keys, counts))
+
+    # add all distances of another histogram (or a {distance: count} dictionary)
+    def update(self, other):
+        if isinstance(other, Distance_Hist):
+            keys, counts = other.arrays()
+            self.pending_arrays.append((keys, counts))
+            self.infinite += other.infinite
+        else:
+            # dictionary keys can be larger than an int64, those are infinite anyway
+            items = other.items()
+            self.infinite += sum([c for k, c in items if k >= INFINITE])
+            finite = [(k, c) for k, c in items if k < INFINITE]
+            self.add_many([k for k, c in finite], [c for k, c in finite])
+
+    def merge(self, other):
+        self.update(other)
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    # merge the buffered distances into the sorted arrays, counts of the same (bucketed) key are summed
+    def compact(self):
+        if not self.pending_keys and not self.pending_arrays:
+            return
+        parts = [(self.sorted_keys, self.sorted_counts)] + self.pending_arrays
+        if self.pending_keys:
+            parts.append((numpy.array(self.pending_keys, dtype = numpy.int64), numpy.array(self.pending_counts, dtype = numpy.int64)))
+        self.pending_keys, self.pending_counts, self.pending_arrays = [], [], []
+
+        keys = bucket_keys(numpy.concatenate([p[0] for p in parts]), self.precision)
+        counts = numpy.concatenate([p[1] for p in parts])
+        order = numpy.argsort(keys, kind = 'mergesort')
+        keys, counts = keys[order], counts[order]
+        if len(keys) > 0:
+            first_of_key = numpy.ones(len(keys), dtype = bool)
+            first_of_key[1:] = keys[1:] != keys[:-1]
+            starts = numpy.flatnonzero(first_of_key)
+            keys, counts = keys[starts], numpy.add.reduceat(counts, starts)
+        self.sorted_keys, self.sorted_counts = keys, counts
+
+    # sorted finite keys and their counts
+    def arrays(self):
+        self.compact()
+        return self.sorted_keys, self.sorted_counts
+
+    # sorted keys and counts with the infinite distances as an INFINITE key, like the dictionaries they replace
+    def all_arrays(self):
+        keys, counts = self.arrays()
+        if self.infinite == 0:
+            return keys, counts
+        return numpy.append(keys, INFINITE), numpy.append(counts, self.infinite)
+
+    def total(self):
+        return int(self.arrays()[1].sum()) + self.infinite
+
+    # running totals of the counts of the finite keys
+    def cumulative(self):
+        return numpy.cumsum(self.arrays()[1])
+
+    # number of distances in [low, high), high None includes the infinite distances
+    def range_count(self, low, high = None):
+        keys, counts = self.arrays()
+        begin = numpy.searchsorted(keys, low, 'left')
+        if high is None:
+            return int(counts[begin:].sum()) + self.infinite
+        return int(counts[begin:numpy.searchsorted(keys, high, 'left')].sum())
+
+    def count_below(self, distance):
+        return self.range_count(numpy.iinfo(numpy.int64).min, distance)
+
+    def count_at_least(self, distance):
+        return self.range_count(distance)
+
+    # read only dictionary interface, missing distances count 0 like in a Counter
+    def __getitem__(self, key):
+        if key >= INFINITE:
+            return self.infinite
+        keys, counts = self.arrays()
+        i = numpy.searchsorted(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return int(counts[i])
+        return 0
+
+    def get(self, key, default = None):
+        if key in self:
+            return self[key]
+        return default
+
+    def __contains__(self, key):
+        if key >= INFINITE:
+            return self.infinite > 0
+        keys = self.arrays()[0]
+        i = numpy.searchsorted(keys, key)
+        return i < len(keys) and keys[i] == key
+
+    def __len__(self):
+        return len(self.arrays()[0]) + (1 if self.infinite > 0 else 0)
+
+    def items(self):
+        keys, counts = self.all_arrays()
+        return zip(keys.tolist(), counts.tolist())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def keys(self):
+        return self.all_arrays()[0].tolist()
+
+    def values(self):
+        return self.all_arrays()[1].tolist()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return "Distance_Hist(%s)" % (self.to_dict())
+
+# hist as a Distance_Hist, dictionaries are converted
+def as_distance_hist(hist, precision = None):
+    if isinstance(hist, Distance_Hist):
+        return hist
+    converted = Distance_Hist(precision = precision)
+    converted.update(hist)
+    return converted
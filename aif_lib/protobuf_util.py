@@ -22,111 +22,195 @@
 import zlib
 
 from google.protobuf.internal import encoder
-from google.protobuf.internal import decoder
-
-def readRawVarint32(stream):
-    raw_varint32 = []
+from google.protobuf.internal import api_implementation
+
+# size of the read-ahead buffer used by Delimited_Reader, large enough to amortise the read calls over thousands of messages
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+# peeking at a field in python is only cheaper than parsing small messages completely with the pure python protobuf implementation, the C++ implementation parses them faster
+PEEK_BEFORE_PARSE = api_implementation.Type() == "python"
+# a varint never takes more than 10 bytes, having this many bytes available means the length prefix can be decoded from the buffer
+MAX_VARINT_SIZE = 10
+# amount of compressed input handed to zlib at once by Gzip_Delimited_Reader
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# decode a varint from a bytearray (indexing yields integers), returns the value and the position after the varint
+def decodeVarint(buff, pos):
+    result, shift = 0, 0
     while 1:
-        b = stream.read(1)
-        # eof
-        if b == "":
-            break
-        raw_varint32.append(b)
-
-        if not (ord(b) & 0x80):
-            # we found a byte starting with a 0, which means it's the last byte of this varint
-            break
-
-    return raw_varint32
-
-def readDelimitedFrom(MessageType, stream):
-    raw_varint32 = readRawVarint32(stream)
-    message = None
-
-    if raw_varint32:
-        size, _ = decoder._DecodeVarint32(raw_varint32, 0)
-
-        data = stream.read(size)
-        if len(data) < size:
-            raise Exception("Unexpected end of file")
+        b = buff[pos]
+        result |= (b & 0x7f) << shift
+        pos += 1
+        if not (b & 0x80):
+            return result, pos
+        shift += 7
+        if shift >= 64:
+            raise Exception("Too many bytes when decoding varint")
+
+# find the field identified by a path of field numbers (e.g. (2, 5) is field 5 of the message in field 2) in the serialized message buff[pos:end] without parsing it
+# returns an integer for varint fields, a string for length-delimited fields and None if the field (or one of its parents) is not present
+def peekField(buff, pos, end, path):
+    last = len(path) - 1
+    for depth, number in enumerate(path):
+        found = False
+        while pos < end:
+            key = buff[pos]
+            if key < 0x80:
+                pos += 1
+            else:
+                key, pos = decodeVarint(buff, pos)
+            wire_type = key & 0x7
+            if wire_type == 0:
+                if key >> 3 == number and depth == last:
+                    return decodeVarint(buff, pos)[0]
+                while buff[pos] & 0x80:
+                    pos += 1
+                pos += 1
+            elif wire_type == 2:
+                size, pos = decodeVarint(buff, pos)
+                if key >> 3 == number:
+                    if depth == last:
+                        return str(buff[pos:pos + size])
+                    # continue in the nested message
+                    end = pos + size
+                    found = True
+                    break
+                pos += size
+            elif wire_type == 1:
+                if key >> 3 == number and depth == last:
+                    return str(buff[pos:pos + 8])
+                pos += 8
+            elif wire_type == 5:
+                if key >> 3 == number and depth == last:
+                    return str(buff[pos:pos + 4])
+                pos += 4
+            else:
+                raise Exception("Unsupported wire type " + str(wire_type))
+        if not found:
+            return None
+
+# Accepts messages of which the field at path has one of the given values, absent fields have the proto3 default value
+class Field_Filter(object):
+    def __init__(self, path, values, default = 0):
+        self.path = tuple(path)
+        self.values = set(values)
+        self.default = default
+
+    def accepts(self, buff, begin, end):
+        value = peekField(buff, begin, end, self.path)
+        if value is None:
+            value = self.default
+        return value in self.values
+
+# Reads length-delimited messages from a large read-ahead buffer instead of issuing two reads per message
+class Delimited_Reader(object):
+    def __init__(self, stream, buffer_size = DEFAULT_BUFFER_SIZE):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        # the buffer is reused for the whole stream, consumed bytes are only dropped when it is refilled
+        self.buff = bytearray()
+        self.pos = 0
+        self.eof = False
+
+    def read_block(self):
+        return self.stream.read(self.buffer_size)
+
+    # drop the consumed part of the buffer in place and append blocks until size bytes are available after the cursor
+    def fill(self, size):
+        del self.buff[:self.pos]
+        self.pos = 0
+        while len(self.buff) < size and not self.eof:
+            block = self.read_block()
+            if not block:
+                self.eof = True
+                break
+            self.buff.extend(block)
+
+        return len(self.buff) >= size
+
+    # locate the next message in the buffer and move the cursor past it, returns its (begin, end) offsets in the buffer or None if there are no messages left
+    def next_message(self):
+        if len(self.buff) - self.pos < MAX_VARINT_SIZE and not self.eof:
+            self.fill(MAX_VARINT_SIZE)
+        if self.pos >= len(self.buff):
+            return None
+
+        # most messages are smaller than 128 bytes, their length prefix is a single byte
+        b = self.buff[self.pos]
+        if b < 0x80:
+            size, begin = b, self.pos + 1
+        else:
+            size, begin = decodeVarint(self.buff, self.pos)
+
+        end = begin + size
+        if end > len(self.buff):
+            # the message continues beyond the buffer, refill and recompute the offsets relative to the new buffer
+            prefix_size = begin - self.pos
+            if not self.fill(prefix_size + size):
+                raise Exception("Unexpected end of file")
+            begin, end = prefix_size, prefix_size + size
+
+        self.pos = end
+
+        return begin, end
+
+    # skip the next message using its length prefix only, returns False if there are no messages left
+    def skip(self):
+        return self.next_message() is not None
+
+    # return the serialized bytes of the next message (accepted by message_filter), None if there are no messages left
+    def read_raw(self, message_filter = None):
+        while 1:
+            bounds = self.next_message()
+            if bounds is None:
+                return None
+            begin, end = bounds
+            # rejected messages are never copied out of the buffer
+            if message_filter is None or message_filter.accepts(self.buff, begin, end):
+                # copy the message out through a memoryview, slicing the bytearray itself would copy twice
+                return memoryview(self.buff)[begin:end].tobytes()
+
+    def read(self, MessageType):
+        data = self.read_raw()
+        if data is None:
+            return None
 
         message = MessageType()
         message.ParseFromString(data)
 
-    return message
-
-def readDelimitedFrom_inplace(message, stream):
-    raw_varint32 = readRawVarint32(stream)
-
-    if raw_varint32:
-        size, _ = decoder._DecodeVarint32(raw_varint32, 0)
+        return message
 
-        data = stream.read(size)
-        if len(data) < size:
-            raise Exception("Unexpected end of file")
+    def read_inplace(self, message):
+        data = self.read_raw()
+        if data is None:
+            return None
 
         message.ParseFromString(data)
 
         return message
-    else:
-        return None
-
-def decodeRawVarint32(dec_buff):
-    raw_varint32 = []
-    for c in dec_buff:
-        # eof
-        if c == "":
-            break
-        raw_varint32.append(c)
-
-        if not (ord(c) & 0x80):
-            # we found a byte starting with a 0, which means it's the last byte of this varint
-            break
-
-    return raw_varint32
-
-def readDelimitedFrom_gzip(MessageType, dec_buff, gzip_stream, decompress_obj):
-    if len(dec_buff) < 4:
-        gzip_buffer = gzip_stream.read(1024)
-        dec_buff += decompress_obj.decompress(gzip_buffer)
-
-    raw_varint32 = decodeRawVarint32(dec_buff)
-    message = None
-
-    if raw_varint32:
-        size, _ = decoder._DecodeVarint32(raw_varint32, 0)
-
-        while len(dec_buff) < size + len(raw_varint32):
-            gzip_buffer = gzip_stream.read(1024)
-            dec_buff += decompress_obj.decompress(gzip_buffer)
-
-        message = MessageType()
-        message.ParseFromString(dec_buff[len(raw_varint32) : size + len(raw_varint32)])
-
-        return message, dec_buff[len(raw_varint32) + size : ]
-    else:
-        return None, None
-
-def readDelimitedFrom_inplace_gzip(message, dec_buff, gzip_stream, decompress_obj):
-    # int max 4 bytes
-    if len(dec_buff) < 4:
-        gzip_buffer = gzip_stream.read(1024)
-        dec_buff += decompress_obj.decompress(gzip_buffer)
-
-    raw_varint32 = decodeRawVarint32(dec_buff)
-
-    if raw_varint32:
-        size, _ = decoder._DecodeVarint32(raw_varint32, 0)
-
-        while len(dec_buff) < size + len(raw_varint32):
-            gzip_buffer = gzip_stream.read(1024)
-            dec_buff += decompress_obj.decompress(gzip_buffer)
-
-        message.ParseFromString(dec_buff[len(raw_varint32) : size + len(raw_varint32)])
 
-        return message, dec_buff[len(raw_varint32) + size : ]
-    else:
-        return None, None
+# Same as Delimited_Reader, but the blocks are decompressed from a gzip stream chunk_size compressed bytes at a time
+class Gzip_Delimited_Reader(Delimited_Reader):
+    def __init__(self, stream, chunk_size = DEFAULT_CHUNK_SIZE):
+        Delimited_Reader.__init__(self, stream)
+        self.chunk_size = chunk_size
+        self.decompress_obj = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+    def read_block(self):
+        while 1:
+            gzip_buffer = self.stream.read(self.chunk_size)
+            if not gzip_buffer:
+                return self.decompress_obj.flush()
+
+            parts = [self.decompress_obj.decompress(gzip_buffer)]
+            # concatenated gzip members, start decompressing the next member
+            while self.decompress_obj.unused_data:
+                unused_data = self.decompress_obj.unused_data
+                self.decompress_obj = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                parts.append(self.decompress_obj.decompress(unused_data))
+
+            block = ''.join(parts)
+            if block:
+                return block
 
 def writeDelimitedTo(message, stream):
     message_str = message.SerializeToString()
@@ -0,0 +1,222 @@
+#  This file is part of the program: Processor Modeling Tool (PMT).
+#
+#  PMT is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  PMT is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with PMT.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  Authors: Sam Van den Steen, Ghent University
+#  Copyright: 2016, Ghent University
+
+import os, sys, shutil, array, numpy
+from stream_reader import Stream_Reader
+
+# columns stored for every StatStack sample, the end columns of dangling samples are 0
+COLUMNS = [
+    ("begin_burst_id", numpy.int64),
+    ("end_burst_id", numpy.int64),
+    ("begin_access_counter", numpy.int64),
+    ("end_access_counter", numpy.int64),
+    ("begin_program_counter", numpy.uint64),
+    ("end_program_counter", numpy.uint64),
+    ("begin_access_type", numpy.uint8),
+    ("end_access_type", numpy.uint8),
+    ("has_end", numpy.bool_),
+]
+# protobuf field paths of the columns (see memory_file.proto), used to apply a protobuf_util.Field_Filter to the columns
+COLUMN_FIELDS = {
+    (1, 1): "begin_burst_id",
+    (1, 2): "begin_access_counter",
+    (1, 3): "begin_program_counter",
+    (1, 5): "begin_access_type",
+    (2, 1): "end_burst_id",
+    (2, 2): "end_access_counter",
+    (2, 3): "end_program_counter",
+    (2, 5): "end_access_type",
+}
+# written last during a conversion, contains the size and modification time of the sample file the columns were converted from
+META_FILE = "source.meta"
+# number of samples that are turned into python objects at once when iterating over the columns
+ITER_CHUNK_SIZE = 65536
+
+def source_stamp(sample_file):
+    stat = os.stat(sample_file)
+    return "%d %d" % (stat.st_size, int(stat.st_mtime))
+
+def column_dir(cache_dir, sample_file):
+    return os.path.join(cache_dir, os.path.basename(sample_file))
+
+def is_converted(cache_dir, sample_file):
+    meta_file = os.path.join(column_dir(cache_dir, sample_file), META_FILE)
+    if not os.path.isfile(meta_file):
+        return False
+    f = open(meta_file, "r")
+    stamp = f.read().strip()
+    f.close()
+    return stamp == source_stamp(sample_file)
+
+# Decode a protobuf sample file once and store every field as a separate .npy file
+def convert_sample_file(sample_file, compressed, cache_dir):
+    target_dir = column_dir(cache_dir, sample_file)
+    tmp_dir = target_dir + ".tmp." + str(os.getpid())
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    # array.array keeps the decoded values as machine integers while the number of samples is not known yet
+    values = dict([(name, array.array('L' if dtype == numpy.uint64 else 'l')) for name, dtype in COLUMNS])
+    sample_reader = Stream_Reader([sample_file], "STATSTACK", compressed)
+    for sample in sample_reader.iter_in_place():
+        values["begin_burst_id"].append(sample.begin.burst_id)
+        values["begin_access_counter"].append(sample.begin.access_counter)
+        values["begin_program_counter"].append(sample.begin.program_counter)
+        values["begin_access_type"].append(sample.begin.access_type)
+        if sample.HasField('end'):
+            values["end_burst_id"].append(sample.end.burst_id)
+            values["end_access_counter"].append(sample.end.access_counter)
+            values["end_program_counter"].append(sample.end.program_counter)
+            values["end_access_type"].append(sample.end.access_type)
+            values["has_end"].append(1)
+        else:
+            values["end_burst_id"].append(0)
+            values["end_access_counter"].append(0)
+            values["end_program_counter"].append(0)
+            values["end_access_type"].append(0)
+            values["has_end"].append(0)
+
+    for name, dtype in COLUMNS:
+        column = numpy.frombuffer(values[name], dtype = numpy.dtype(values[name].typecode)).astype(dtype)
+        numpy.save(os.path.join(tmp_dir, name + ".npy"), column)
+
+    f = open(os.path.join(tmp_dir, META_FILE), "w")
+    f.write(source_stamp(sample_file) + "\n")
+    f.close()
+
+    # another run might have converted the same file in the meantime, both conversions are identical
+    # a complete conversion is kept, other runs may have memory-mapped it already
+    if is_converted(cache_dir, sample_file):
+        shutil.rmtree(tmp_dir, ignore_errors = True)
+        return
+
+    # an outdated or partial conversion is moved aside first, so the target is replaced by a single rename
+    stale_dir = None
+    if os.path.exists(target_dir):
+        stale_dir = target_dir + ".stale." + str(os.getpid())
+        try:
+            os.rename(target_dir, stale_dir)
+        except OSError:
+            stale_dir = None
+    try:
+        os.rename(tmp_dir, target_dir)
+    except OSError:
+        # another run renamed its conversion into place first
+        shutil.rmtree(tmp_dir, ignore_errors = True)
+    if stale_dir != None:
+        shutil.rmtree(stale_dir, ignore_errors = True)
+
+# Memory-mapped columns of a single sample file
+class Sample_Columns(object):
+    def __init__(self, sample_file, compressed, cache_dir):
+        if not is_converted(cache_dir, sample_file):
+            convert_sample_file(sample_file, compressed, cache_dir)
+
+        self.columns = {}
+        for name, dtype in COLUMNS:
+            self.columns[name] = numpy.load(os.path.join(column_dir(cache_dir, sample_file), name + ".npy"), mmap_mode = 'r')
+        self.size = len(self.columns["has_end"])
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+class Column_Access(object):
+    __slots__ = ("burst_id", "access_counter", "program_counter", "access_type")
+
+# Stands in for a memory_file_pb2.Sample, so code written against the protobuf messages can iterate over the columns
+class Column_Sample(object):
+    __slots__ = ("begin", "end", "has_end")
+
+    def __init__(self):
+        self.begin = Column_Access()
+        self.end = Column_Access()
+        self.has_end = False
+
+    def HasField(self, name):
+        if name == "end":
+            return self.has_end
+        return True
+
+# Drop-in replacement for a STATSTACK Stream_Reader that reads the samples from their memory-mapped columns
+class Column_Reader(object):
+    def __init__(self, file_list, compression, cache_dir, message_filter = None):
+        self.file_list = file_list
+        self.compression = compression
+        self.cache_dir = cache_dir
+        self.message_filter = message_filter
+        if self.message_filter != None and not self.message_filter.path in COLUMN_FIELDS:
+            raise Exception("No column for field " + str(self.message_filter.path))
+
+    # the columns are only memory-mapped while they are iterated, there is nothing to release
+    def close(self):
+        pass
+
+    def iter_columns(self):
+        for sample_file in self.file_list:
+            yield Sample_Columns(sample_file, self.compression, self.cache_dir)
+
+    # (burst, rdist, PC, access type) of the samples of the given access types, the same events as landing_events.sample_events
+    # the selection and rdists are computed per chunk of columns, the access types select at least the samples the message filter does
+    def iter_events(self, access_types, takeoff):
+        access = "begin" if takeoff else "end"
+        for columns in self.iter_columns():
+            for first in range(0, len(columns), ITER_CHUNK_SIZE):
+                last = first + ITER_CHUNK_SIZE
+                access_type = columns[access + "_access_type"][first:last]
+                selected = numpy.in1d(access_type, access_types)
+                bursts = columns[access + "_burst_id"][first:last][selected]
+                rdists = columns["end_access_counter"][first:last][selected] - columns["begin_access_counter"][first:last][selected] - 1
+                PCs = columns["begin_program_counter"][first:last][selected]
+                for event in zip(bursts.tolist(), rdists.tolist(), PCs.tolist(), access_type[selected].tolist()):
+                    yield event
+
+    # events of dangling samples, the same as landing_events.dangling_events
+    def iter_dangling_events(self, access_types):
+        for columns in self.iter_columns():
+            for first in range(0, len(columns), ITER_CHUNK_SIZE):
+                last = first + ITER_CHUNK_SIZE
+                access_type = columns["begin_access_type"][first:last]
+                selected = numpy.in1d(access_type, access_types)
+                bursts = columns["begin_burst_id"][first:last][selected]
+                PCs = columns["begin_program_counter"][first:last][selected]
+                for burst, PC, event_type in zip(bursts.tolist(), PCs.tolist(), access_type[selected].tolist()):
+                    yield burst, sys.maxint, PC, event_type
+
+    def iter_in_place(self):
+        sample = Column_Sample()
+        begin, end = sample.begin, sample.end
+        for columns in self.iter_columns():
+            for first in range(0, len(columns), ITER_CHUNK_SIZE):
+                last = first + ITER_CHUNK_SIZE
+                if self.message_filter == None:
+                    chunk = [columns[name][first:last].tolist() for name, dtype in COLUMNS]
+                else:
+                    # the rejected samples are dropped before any python objects are created
+                    field = columns[COLUMN_FIELDS[self.message_filter.path]][first:last]
+                    mask = numpy.in1d(field, list(self.message_filter.values))
+                    chunk = [columns[name][first:last][mask].tolist() for name, dtype in COLUMNS]
+                for b_burst, e_burst, b_counter, e_counter, b_pc, e_pc, b_type, e_type, has_end in zip(*chunk):
+                    begin.burst_id, begin.access_counter, begin.program_counter, begin.access_type = b_burst, b_counter, b_pc, b_type
+                    end.burst_id, end.access_counter, end.program_counter, end.access_type = e_burst, e_counter, e_pc, e_type
+                    sample.has_end = has_end
+
+                    yield sample
@@ -18,60 +18,251 @@
 
 import protobuf_util
 import sd_hist_file_pb2
-import itertools, zlib, pdb
+from distance_hist import Distance_Hist, as_distance_hist
+from google.protobuf.internal import encoder
+import itertools, zlib, os, hashlib, numpy, pdb
+
+# suffix of the sidecar file written when a sd hist file is completed
+FOOTER_SUFFIX = ".footer"
+# serialized messages are collected until they reach this size and then written at once, as a single zlib block if compression is enabled
+DEFAULT_BATCH_SIZE = 1024 * 1024
+# files written in an older format are not reused
+SD_HIST_FORMAT = 2
+
+# size of the blocks in which input files are hashed
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# sha1 of the contents of a file, remembered in digest_dir together with the size and modification time of the file, so unchanged inputs are only hashed once
+def file_digest(filename, digest_dir):
+    stat = os.stat(filename)
+    stamp = "%d %d" % (stat.st_size, int(stat.st_mtime))
+    digest_file = os.path.join(digest_dir, os.path.basename(filename) + ".sha1")
+    if os.path.isfile(digest_file):
+        f = open(digest_file, 'r')
+        cached = f.read().split()
+        f.close()
+        if len(cached) == 3 and " ".join(cached[:2]) == stamp:
+            return cached[2]
+
+    sha1 = hashlib.sha1()
+    f = open(filename, 'rb')
+    while 1:
+        block = f.read(HASH_BLOCK_SIZE)
+        if not block:
+            break
+        sha1.update(block)
+    f.close()
+    digest = sha1.hexdigest()
+
+    if not os.path.exists(digest_dir):
+        try:
+            os.makedirs(digest_dir)
+        except OSError:
+            # created by a concurrent run
+            pass
+    tmp_file = digest_file + ".tmp." + str(os.getpid())
+    f = open(tmp_file, 'w')
+    f.write(stamp + " " + digest + "\n")
+    f.close()
+    os.rename(tmp_file, digest_file)
+
+    return digest
+
+# cache entries are named after a hash of everything that determines their contents
+def cache_key(items):
+    return hashlib.sha1(repr(items)).hexdigest()[:16]
+
+def footer_file(filename):
+    return filename + FOOTER_SUFFIX
+
+def read_footer(filename):
+    if not os.path.isfile(footer_file(filename)):
+        return None
+    f = open(footer_file(filename), 'rb')
+    footer = sd_hist_file_pb2.sd_hist_footer()
+    try:
+        footer.ParseFromString(f.read())
+    except Exception:
+        return None
+    finally:
+        f.close()
+
+    return footer
+
+# a sd hist file can only be reused if its writer was closed, truncated files from killed runs have no (matching) footer
+def is_complete(filename):
+    if not os.path.isfile(filename):
+        return False
+    footer = read_footer(filename)
+    return footer != None and footer.format == SD_HIST_FORMAT and footer.size == os.path.getsize(filename) and len(footer.burst_id) == footer.messages
+
+# turn the delta coded stack distances and their counts into a Distance_Hist
+def decode_hist(hist):
+    sds = numpy.cumsum(numpy.fromiter(hist.sd_delta, numpy.int64, len(hist.sd_delta)))
+    counts = numpy.fromiter(hist.count, numpy.int64, len(hist.count))
+    return Distance_Hist(sds, counts)
+
+# iterate over the delimited messages in a decompressed block
+def iter_block(block):
+    pos = 0
+    while pos < len(block):
+        size, begin = protobuf_util.decodeVarint(block, pos)
+        pos = begin + size
+        yield begin, pos
 
 class SD_Hist_Reader(object):
-    def __init__(self, filename, PC = False, compression = False):
+    def __init__(self, filename, PC = False, buffer_size = protobuf_util.DEFAULT_BUFFER_SIZE):
+        self.filename = filename
         self.file = open(filename, 'rb')
         self.PC = PC
-        self.compression = compression
-        if self.compression:
-            self.dec_buff = ""
-            self.decompress_obj = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        self.footer = read_footer(filename)
+        if self.footer == None or self.footer.format != SD_HIST_FORMAT:
+            raise Exception("No valid footer found for " + filename)
+        self.compression = self.footer.compression
+        self.PCs = list(self.footer.PC)
+        self.reader = protobuf_util.Delimited_Reader(self.file, buffer_size)
+        self.index = None
+        # last decompressed block, consecutive bursts are mostly in the same block
+        self.block_offset, self.block = None, None
 
-    def iter_in_place(self):
+    def new_message(self):
         if not self.PC:
-            message = sd_hist_file_pb2.sd_hist()
+            return sd_hist_file_pb2.sd_hist()
         else:
-            message = sd_hist_file_pb2.sd_PC_hist()
+            return sd_hist_file_pb2.sd_PC_hist()
+
+    # serialized messages in file order
+    def iter_raw(self):
         while 1:
-            if self.compression:
-                msg, self.dec_buff = protobuf_util.readDelimitedFrom_inplace_gzip(message, self.dec_buff, self.file, self.decompress_obj)
-            else:
-                msg = protobuf_util.readDelimitedFrom_inplace(message, self.file)
-            if msg is None:
+            data = self.reader.read_raw()
+            if data is None:
                 break
+            if not self.compression:
+                yield data
+            else:
+                block = bytearray(zlib.decompress(data))
+                for begin, end in iter_block(block):
+                    yield str(block[begin:end])
 
-            yield msg
+    def iter_in_place(self):
+        message = self.new_message()
+        for data in self.iter_raw():
+            message.ParseFromString(data)
+            yield message
 
     def __iter__(self):
-        while 1:
-            if self.compression:
-                if not self.PC:
-                    msg, self.dec_buff = protobuf_util.readDelimitedFrom_gzip(sd_hist_file_pb2.sd_hist, self.dec_buff, self.file, self.decompress_obj)
-                else:
-                    msg, self.dec_buff = protobuf_util.readDelimitedFrom_gzip(sd_hist_file_pb2.sd_PC_hist, self.dec_buff, self.file, self.decompress_obj)
+        for data in self.iter_raw():
+            message = self.new_message()
+            message.ParseFromString(data)
+            yield message
+
+    # decode a message into a Distance_Hist, or a dictionary of them per PC
+    def decode(self, message):
+        if not self.PC:
+            return decode_hist(message)
+        else:
+            return dict([(self.PCs[hist.id], decode_hist(hist)) for hist in message.sd_hists])
+
+    # decoded histograms in file order
+    def iter_hists(self):
+        message = self.new_message()
+        for data in self.iter_raw():
+            message.ParseFromString(data)
+            if not self.PC:
+                yield message.id, self.decode(message)
             else:
-                if not self.PC:
-                    msg = protobuf_util.readDelimitedFrom(sd_hist_file_pb2.sd_hist, self.file)
-                else:
-                    msg = protobuf_util.readDelimitedFrom(sd_hist_file_pb2.sd_PC_hist, self.file)
-            if msg is None:
-                break
+                yield message.burst_id, self.decode(message)
+
+    # random access through the burst index in the footer, independent of the sequential iterators above
+    def load_index(self):
+        self.index = {}
+        block_pos = self.footer.block_pos if self.compression else itertools.repeat(0)
+        for burst, offset, pos in zip(self.footer.burst_id, self.footer.offset, block_pos):
+            # the same burst can be written more than once, all copies are identical
+            if not burst in self.index:
+                self.index[int(burst)] = (int(offset), int(pos))
+
+    def bursts(self):
+        if self.index == None:
+            self.load_index()
+        return sorted(self.index.keys())
+
+    def has_burst(self, burst):
+        if self.index == None:
+            self.load_index()
+        return burst in self.index
+
+    # read the delimited record (message or compressed block) starting at offset
+    def read_record(self, offset):
+        self.file.seek(offset)
+        data = self.file.read(protobuf_util.MAX_VARINT_SIZE)
+        size, begin = protobuf_util.decodeVarint(bytearray(data), 0)
+        if begin + size > len(data):
+            data += self.file.read(begin + size - len(data))
+        if begin + size > len(data):
+            raise Exception("Unexpected end of file")
+
+        return data[begin:begin + size]
+
+    def read_burst(self, burst, message = None):
+        if self.index == None:
+            self.load_index()
+        if not burst in self.index:
+            raise Exception("Burst " + str(burst) + " not found in " + self.filename)
+        if message == None:
+            message = self.new_message()
+
+        offset, pos = self.index[burst]
+        if not self.compression:
+            message.ParseFromString(self.read_record(offset))
+        else:
+            if offset != self.block_offset:
+                self.block = bytearray(zlib.decompress(self.read_record(offset)))
+                self.block_offset = offset
+            size, begin = protobuf_util.decodeVarint(self.block, pos)
+            message.ParseFromString(str(self.block[begin:begin + size]))
+
+        return message
 
-            yield msg
+    def read_bursts(self, bursts):
+        message = self.new_message()
+        for burst in bursts:
+            yield burst, self.decode(self.read_burst(burst, message))
 
+# Writes to a temporary file that only replaces filename when the writer is closed
 class SD_Hist_Writer(object):
-    def __init__(self, filename):
+    def __init__(self, filename, compression = False, batch_size = DEFAULT_BATCH_SIZE):
         self.filename = filename
+        # unique per process, concurrent runs never write to the same temporary file
+        self.tmp_filename = filename + ".tmp." + str(os.getpid())
+        self.compression = compression
+        self.batch_size = batch_size
+        # the file is only created when the first message is written
+        self.file = None
+        self.batch, self.batch_bytes = [], 0
+        self.messages, self.size = 0, 0
+        self.burst_ids, self.offsets, self.block_pos = [], [], []
+        # PCs are interned, the messages only contain their index in the PC table
+        self.PCs, self.PC_ids = [], {}
+
+    # sd_count is a Distance_Hist or a {stack distance: count} dictionary, infinite distances are stored as sys.maxint
+    def encode_hist(self, hist, sd_count):
+        sds, counts = as_distance_hist(sd_count).all_arrays()
+        hist.sd_delta.extend(numpy.diff(numpy.append(0, sds)).tolist())
+        hist.count.extend(counts.tolist())
+
+    def intern_PC(self, PC):
+        if not PC in self.PC_ids:
+            self.PC_ids[PC] = len(self.PCs)
+            self.PCs.append(PC)
+        return self.PC_ids[PC]
 
     def dict_to_proto(self, sd_dict):
         all_bursts = {}
         for burst, sd_count in sd_dict.iteritems():
             burst_hist = sd_hist_file_pb2.sd_hist()
             burst_hist.id = burst
-            burst_hist.sd.extend(sd_count.keys())
-            burst_hist.count.extend(sd_count.values())
+            self.encode_hist(burst_hist, sd_count)
             all_bursts[burst] = burst_hist
 
         return sorted(all_bursts.items())
@@ -83,15 +274,64 @@ class SD_Hist_Writer(object):
             burst_hist.burst_id = burst
             for PC, sd_dict in PC_dict.iteritems():
                 PC_hist = burst_hist.sd_hists.add()
-                PC_hist.id = PC
-                PC_hist.sd.extend(sd_dict.keys())
-                PC_hist.count.extend(sd_dict.values())
+                PC_hist.id = self.intern_PC(PC)
+                self.encode_hist(PC_hist, sd_dict)
 
             all_bursts[burst] = burst_hist
 
         return sorted(all_bursts.items())
 
-    def write_sd_hist(self, message):
-        self.file = open(self.filename, 'ab')
-        protobuf_util.writeDelimitedTo(message, self.file)
+    def write_sd_hist(self, message, burst):
+        if self.file == None:
+            self.file = open(self.tmp_filename, 'wb')
+        self.burst_ids.append(burst)
+        if self.compression:
+            self.offsets.append(self.size)
+            self.block_pos.append(self.batch_bytes)
+        else:
+            self.offsets.append(self.size + self.batch_bytes)
+        message_str = message.SerializeToString()
+        self.batch.append(encoder._VarintBytes(len(message_str)))
+        self.batch.append(message_str)
+        self.batch_bytes += len(self.batch[-2]) + len(message_str)
+        self.messages += 1
+        if self.batch_bytes >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            data = "".join(self.batch)
+            if self.compression:
+                data = zlib.compress(data)
+                data = encoder._VarintBytes(len(data)) + data
+            self.file.write(data)
+            self.size += len(data)
+            self.batch, self.batch_bytes = [], 0
+
+    # move the finished file in place and write its footer, nothing happens if no message was written
+    def close(self):
+        if self.file == None:
+            return
+        self.flush()
         self.file.close()
+        self.file = None
+
+        # remove the footer of a previous (rejected) file first, so the new file is never paired with it
+        if os.path.isfile(footer_file(self.filename)):
+            os.remove(footer_file(self.filename))
+        os.rename(self.tmp_filename, self.filename)
+
+        footer = sd_hist_file_pb2.sd_hist_footer()
+        footer.format = SD_HIST_FORMAT
+        footer.messages = self.messages
+        footer.size = self.size
+        footer.burst_id.extend(self.burst_ids)
+        footer.offset.extend(self.offsets)
+        footer.compression = self.compression
+        footer.block_pos.extend(self.block_pos)
+        footer.PC.extend(self.PCs)
+        tmp_footer = footer_file(self.tmp_filename)
+        f = open(tmp_footer, 'wb')
+        f.write(footer.SerializeToString())
+        f.close()
+        os.rename(tmp_footer, footer_file(self.filename))
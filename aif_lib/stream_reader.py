@@ -16,37 +16,174 @@
 #  Authors: Sam Van den Steen, Ghent University
 #  Copyright: 2016, Ghent University
 
-import itertools, zlib, pdb
+import itertools, zlib, pdb, sys, threading, Queue
 import branch_file_pb2, memory_file_pb2, mlp_file_pb2, cold_file_pb2, utrace_file_pb2
 import protobuf_util
 
+# the read-ahead thread hands over serialized messages in batches of at least this many bytes
+READ_AHEAD_BATCH_SIZE = 1024 * 1024
+# seconds a read-ahead thread waits on a full queue before it checks whether the stream was closed
+READ_AHEAD_PUT_TIMEOUT = 0.1
+
+# Decompresses and frames all files of a Stream_Reader on a separate thread, so I/O and decompression overlap with the consumer
+class Read_Ahead_Thread(threading.Thread):
+    def __init__(self, file_list, create_reader, queue_size, message_filter = None):
+        threading.Thread.__init__(self)
+        # never keep the interpreter alive because a stream was not read until the end
+        self.daemon = True
+        self.file_list = file_list
+        self.create_reader = create_reader
+        self.queue = Queue.Queue(queue_size)
+        self.message_filter = message_filter
+        # set when the consumer stops reading before the end of the stream
+        self.stop_event = threading.Event()
+
+    # put an item on the queue, returns False if the stream was closed while waiting for room
+    def put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout = READ_AHEAD_PUT_TIMEOUT)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def run(self):
+        open_files = []
+        try:
+            open_files.append(open(self.file_list[0], 'rb'))
+            for i in range(len(self.file_list)):
+                current_file = open_files[-1]
+                # open the next file before the current one runs out
+                if i + 1 < len(self.file_list):
+                    open_files.append(open(self.file_list[i + 1], 'rb'))
+
+                reader = self.create_reader(current_file)
+                batch, batch_size = [], 0
+                while 1:
+                    data = reader.read_raw(self.message_filter)
+                    if data is None:
+                        break
+                    batch.append(data)
+                    batch_size += len(data)
+                    if batch_size >= READ_AHEAD_BATCH_SIZE:
+                        if not self.put(batch):
+                            return
+                        batch, batch_size = [], 0
+                if batch and not self.put(batch):
+                    return
+
+                current_file.close()
+        except Exception:
+            # hand the exception over to the consumer, it is raised again when the stream gets to this point
+            self.put(sys.exc_info())
+        finally:
+            for f in open_files:
+                f.close()
+
+        self.put(None)
+
+    # stop reading ahead and drop the batches that were not consumed
+    def stop(self):
+        self.stop_event.set()
+        while 1:
+            try:
+                self.queue.get_nowait()
+            except Queue.Empty:
+                break
+        self.join()
+
 class Stream_Reader(object):
-    def __init__(self, file_list, file_type, compression):
+    def __init__(self, file_list, file_type, compression, buffer_size = protobuf_util.DEFAULT_BUFFER_SIZE, chunk_size = protobuf_util.DEFAULT_CHUNK_SIZE, read_ahead = 0, message_filter = None):
         self.file_list = file_list
         self.file_type = file_type
         self.compression = compression
-        self.file = open(self.file_list[0], 'rb')
+        self.buffer_size = buffer_size
+        self.chunk_size = chunk_size
+        # number of batches the read-ahead thread may run ahead of the consumer, 0 reads on the calling thread
+        self.read_ahead = read_ahead
+        # only messages accepted by this protobuf_util.Field_Filter are returned, the others are skipped without being parsed
+        self.message_filter = message_filter
+        if self.read_ahead > 0:
+            self.batch, self.batch_pos, self.exhausted = [], 0, False
+            self.read_ahead_thread = Read_Ahead_Thread(self.file_list, self.create_reader, self.read_ahead, self.message_filter)
+            self.read_ahead_thread.start()
+        else:
+            self.file = open(self.file_list[0], 'rb')
+            self.reader = self.create_reader(self.file)
+            self.next_file = 1
+
+    # release the file and read-ahead thread of a stream that is not read until the end, it can not be read anymore after this
+    def close(self):
+        if self.read_ahead > 0:
+            self.read_ahead_thread.stop()
+            self.batch, self.batch_pos, self.exhausted = [], 0, True
+        else:
+            self.file.close()
+
+    def create_reader(self, f):
         if self.compression:
-            self.dec_buff = ""
-            self.decompress_obj = zlib.decompressobj(zlib.MAX_WBITS | 16)
-        self.next_file = 1
+            return protobuf_util.Gzip_Delimited_Reader(f, self.chunk_size)
+        else:
+            return protobuf_util.Delimited_Reader(f, self.buffer_size)
 
     def open_next_file(self):
         self.file.close()
         self.file = open(self.file_list[self.next_file], 'rb')
-        if self.compression:
-            self.dec_buff = ""
-            self.decompress_obj = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        self.reader = self.create_reader(self.file)
         self.next_file += 1
 
+    # return the serialized bytes of the next message in the file list, None if all files are exhausted
+    def read_raw(self):
+        if self.read_ahead > 0:
+            while self.batch_pos >= len(self.batch):
+                if self.exhausted:
+                    return None
+                batch = self.read_ahead_thread.queue.get()
+                if batch is None:
+                    # the thread does not outlive a stream that was read until the end
+                    self.read_ahead_thread.join()
+                    self.exhausted = True
+                    return None
+                if isinstance(batch, tuple):
+                    self.exhausted = True
+                    raise batch[0], batch[1], batch[2]
+                self.batch, self.batch_pos = batch, 0
+
+            data = self.batch[self.batch_pos]
+            self.batch_pos += 1
+            return data
+
+        while 1:
+            data = self.reader.read_raw(self.message_filter)
+            if data is not None or self.next_file >= len(self.file_list):
+                return data
+            self.open_next_file()
+
+    # skip up to count messages without decoding them, returns the number of messages skipped
+    def skip(self, count = 1):
+        skipped = 0
+        while skipped < count:
+            if self.read_ahead > 0 or self.message_filter is not None:
+                if self.read_raw() is None:
+                    break
+            elif not self.reader.skip():
+                if self.next_file >= len(self.file_list):
+                    break
+                self.open_next_file()
+                continue
+            skipped += 1
+
+        return skipped
+
     def read_message(self):
         if self.file_type == "UTRACE":
             message = utrace_file_pb2.ID_string()
-            if self.compression:
-                msg, self.dec_buff = protobuf_util.readDelimitedFrom_inplace_gzip(message, self.dec_buff, self.file, self.decompress_obj)
-            else:
-                msg = protobuf_util.readDelimitedFrom_inplace(message, self.file)
-            return msg
+            data = self.read_raw()
+            if data is None:
+                return None
+            message.ParseFromString(data)
+            return message
         else:
             print "Not supported!"
             sys.exit(1)
@@ -63,18 +200,12 @@ class Stream_Reader(object):
         elif self.file_type == "UTRACE":
             message = utrace_file_pb2.uTrace()
         while 1:
-            if self.compression:
-                msg, self.dec_buff = protobuf_util.readDelimitedFrom_inplace_gzip(message, self.dec_buff, self.file, self.decompress_obj)
-            else:
-                msg = protobuf_util.readDelimitedFrom_inplace(message, self.file)
-            if msg is None:
-                if self.next_file < len(self.file_list):
-                    self.open_next_file()
-                    continue
-                else:
-                    break
+            data = self.read_raw()
+            if data is None:
+                break
+            message.ParseFromString(data)
 
-            yield msg
+            yield message
 
     def iter(self):
         if self.file_type == "BRANCH":
@@ -88,15 +219,10 @@ class Stream_Reader(object):
         elif self.file_type == "UTRACE":
             message = utrace_file_pb2.uTrace
         while 1:
-            if self.compression:
-                msg, self.dec_buff = protobuf_util.readDelimitedFrom_gzip(message, self.dec_buff, self.file, self.decompress_obj)
-            else:
-                msg = protobuf_util.readDelimitedFrom(message, self.file)
-            if msg is None:
-                if self.next_file < len(self.file_list):
-                    self.open_next_file()
-                    continue
-                else:
-                    break
+            data = self.read_raw()
+            if data is None:
+                break
+            msg = message()
+            msg.ParseFromString(data)
 
             yield msg
@@ -19,8 +19,8 @@
 #  Copyright: 2016, Ghent University
 
 import os, getopt, sys, pdb, time, datetime, random, shutil, signal, subprocess
-from in_out import Config, Constants, Data_Reader, Debug_Printer, Progress_Printer, Results_Printer
-from models import Statstack, Base_Model, Branch_Model, Cache_Model, MLP_Model
+from in_out import Config, Constants, Data_Reader, Debug_Printer, Progress_Printer, Results_Printer, statstack_options
+from models import Statstack, Miss_Ratio_Curves, Base_Model, Branch_Model, Cache_Model, MLP_Model, start_sdist_pool, close_statstacks
 from multiprocessing import Pool, Lock
 
 #########################################
@@ -28,7 +28,7 @@ from multiprocessing import Pool, Lock
 #########################################
 
 def usage():
-	print "./evaluate_model.py <-i | --input> <-o | --output> <-b | --benchmarks> [-c | --config] [-m | --mlp] [-p | --parallel] [-a | --argument] [--statstack] [--queuing] [--prefetch] [--cpi-stack]"
+	print "./evaluate_model.py <-i | --input> <-o | --output> <-b | --benchmarks> [-c | --config] [-m | --mlp] [-p | --parallel] [-a | --argument] [--statstack] [--queuing] [--prefetch] [--cpi-stack] [--read-ahead] [--statstack-processes] [--sample-columns] [--compress-sd-hists] [--cache-dir] [--mapping-cache] [--statstack-memory] [--spill-rdist-hists] [--sd-hist-precision] [--miss-ratio-curves]"
 	print "-i | --input directory with data to calculate the model\n\tDEFAULT: current directory"
 	print "-o | --output directory to put result files\n\tDEFAULT: current directory"
 	print "-b | --benchmarks benchmarks for which to calculate the model\n\tDEFAULT: all spec train benchmarks (all inputs)"
@@ -40,6 +40,8 @@ def usage():
 	print "--queuing use a simple queuing model based on the MLP\n\toptions: MLP, None\n\tDEFAULT: MLP"
 	print "--prefetch use stride prefetcher to eliminate some misses\n\tDEFAULT: disabled (no argument needed, using the flag => prefetcher enabled)"
 	print "--cpi-stack plot a CPI stack using the model predictions\n\tRequires installation of python-matplotlib"
+	print "--miss-ratio-curves only run statstack and store the miss ratio curves of every window in <output>/<benchmark>/miss_ratio_curves.pickle, see models.load_miss_ratio_curves\n\tDEFAULT: disabled (no argument needed, using the flag => only miss ratio curves)"
+	statstack_options.usage()
 	print "Example:"
 	print "./evaluate_model.py -c config/nehalem.cfg -i ~/profiled -o test -b gcc --mlp stride --statstack new -p 1 --cpi-stack"
 
@@ -55,22 +57,16 @@ def set_completed(result):
 
 def parse_command_line(constants):
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], "c:i:o:b:m:s:p:a:h", ['config=', 'input=', 'output=', 'benchmarks=', 'mlp=', 'statstack=', 'parallel=', 'argument=', 'queuing', 'prefetch', 'cpi-stack', 'help'])
+		opts, args = getopt.getopt(sys.argv[1:], statstack_options.SHORT_OPTIONS + "m:s:", statstack_options.LONG_OPTIONS + ['mlp=', 'statstack=', 'queuing', 'prefetch', 'cpi-stack', 'miss-ratio-curves'])
 	except getopt.GetoptError, e:
 		# print help information and exit:
 		print e
 		usage()
 
 	for o, a in opts:
-		if o in ("-c", "--config"):
-			constants.processor_config = a
-		elif o in ("-i", "--input"):
-			constants.input_dir = os.path.abspath(os.path.join(constants.top_level_dir, a))
-		elif o in ("-o", "--output"):
-			constants.output_dir = os.path.abspath(os.path.join(constants.top_level_dir, a))
-		elif o in ("-b", "--benchmarks"):
-			constants.benchmarks = a.split(",")
-		elif o in ("-m", "--mlp"):
+		if statstack_options.parse_option(constants, o, a):
+			continue
+		if o in ("-m", "--mlp"):
 			valid = ("cold", "stride", "cold_stride")
 			if a not in valid:
 				print "Not a valid value for the option mlp! Values can be " + str(valid)
@@ -82,16 +78,6 @@ def parse_command_line(constants):
 				print "Not a valid value for the option statstack! Values can be " + str(valid)
 				sys.exit(1)
 			constants.statstack = a
-		elif o in ("-p", "--parallel"):
-			constants.parallel = int(a)
-		elif o in ("-a", "--argument"):
-			# format is always:
-			# structure/parameter=value
-			structure = a.split('/')[0]
-			parameter_value = a.split('/')[1]
-			if not structure in constants.overwrite_config_parameters:
-				constants.overwrite_config_parameters[structure] = {}
-			constants.overwrite_config_parameters[structure][parameter_value.split("=")[0]] = parameter_value.split("=")[1]
 		elif o in ("--queuing"):
 			valid = ("MLP", "None")
 			if a not in valid:
@@ -102,6 +88,8 @@ def parse_command_line(constants):
 			constants.prefetch = True
 		elif o in ("--cpi-stack"):
 			constants.cpi_stack = True
+		elif o in ("--miss-ratio-curves"):
+			constants.miss_ratio_curves = True
 		elif o in ("-h", "--help"):
 			usage()
 			sys.exit(0)
@@ -171,7 +159,8 @@ def calculate_model(benchmark, constants, config):
 	physical_dispatch_width = config.get_dispatch_width()
 
 	input_root = os.path.join(constants.input_dir, benchmark)
-	data_reader = Data_Reader(input_root, config)
+	# the model input streams are opened once the sdist processes of statstack were forked
+	data_reader = Data_Reader(input_root, config, constants.read_ahead, log_only = True)
 
 	base_model = Base_Model(constants, config, benchmark)
 	cache_model = Cache_Model(constants, config, benchmark)
@@ -186,13 +175,17 @@ def calculate_model(benchmark, constants, config):
 	# execute statstack per benchmark
 	# def __init__(self, input_root, benchmark, base_name, ss_version, _type, content)
 	progress_printer.print_message("Executing preliminary Statstack work:")
-	ss_data_load = Statstack(constants, benchmark, "data", "new", "sample", "data", profiler_metadata, progress_printer)
-	ss_data_store = Statstack(constants, benchmark, "data", "new", "sample", "data", profiler_metadata, progress_printer)
+	# one Statstack reads the data samples once for both the load and store stack distances
+	ss_data = Statstack(constants, benchmark, "data", "new", "sample", "data", profiler_metadata, progress_printer)
 	ss_trace = Statstack(constants, benchmark, "trace", "new", "trace", "data", profiler_metadata, progress_printer)
 	ss_instr = Statstack(constants, benchmark, "instr", "new", "sample", "instr", profiler_metadata, progress_printer)
-	ss_data_load_aligned_bursts = ss_data_load.align_bursts_windows(window_bounds)
-	ss_data_store_aligned_bursts = ss_data_store.align_bursts_windows(window_bounds)
+	ss_data_aligned_bursts = ss_data.align_bursts_windows(window_bounds)
 	ss_instr_aligned_bursts = ss_instr.align_bursts_windows(window_bounds)
+	# the interpolation weights of all windows are computed once
+	ss_data_interpolation = ss_data.window_interpolation(window_bounds, ss_data_aligned_bursts)
+	ss_instr_interpolation = ss_instr.window_interpolation(window_bounds, ss_instr_aligned_bursts)
+	start_sdist_pool(constants, [ss_data, ss_trace, ss_instr])
+	data_reader.open_streams()
 
 	# make data structures
 	global_D_eff, global_stats = [], []
@@ -203,29 +196,29 @@ def calculate_model(benchmark, constants, config):
 	# loop over windows
 	trace_counter = 0
 	progress_printer.setup_progressbar(message = "\nCalculating model:")
-	for window_instr, data_load_bursts, data_store_bursts, instr_bursts in zip(window_bounds, ss_data_load_aligned_bursts, ss_data_store_aligned_bursts, ss_instr_aligned_bursts):
+	for window_instr, data_bursts, instr_bursts in zip(window_bounds, ss_data_aligned_bursts, ss_instr_aligned_bursts):
 		progress_printer.print_progress(trace_counter)
 
 		# statstack, get stack distance histograms
-		load_sd_hist = ss_data_load.get_sd_hists(_type='r', bursts = data_load_bursts)
-		store_sd_hist = ss_data_store.get_sd_hists(_type='w', bursts = data_store_bursts)
+		load_sd_hist = ss_data.get_sd_hists(_type='r', bursts = data_bursts)
+		store_sd_hist = ss_data.get_sd_hists(_type='w', bursts = data_bursts)
 		trace_sd_hist = ss_trace.get_sd_hists(_type='r', bursts = [trace_counter])
 		instr_sd_hist = ss_instr.get_sd_hists(_type='r', bursts = instr_bursts)
 
 		# transform sd hists to miss rates
-		load_miss_ratios = ss_data_load.calculate_sample_miss_ratios(cache_sizes, load_sd_hist, cacheline_size)
-		store_miss_ratios = ss_data_store.calculate_sample_miss_ratios(cache_sizes, store_sd_hist, cacheline_size)
+		load_miss_ratios = ss_data.calculate_sample_miss_ratios(cache_sizes, load_sd_hist, cacheline_size)
+		store_miss_ratios = ss_data.calculate_sample_miss_ratios(cache_sizes, store_sd_hist, cacheline_size)
 
 		# interpolating load and store miss rates
-		interpolated_load_miss_ratios = ss_data_load.interpolate_miss_ratios(window_instr, data_load_bursts, load_miss_ratios)
-		interpolated_store_miss_ratios = ss_data_store.interpolate_miss_ratios(window_instr, data_store_bursts, store_miss_ratios)
+		interpolated_load_miss_ratios = ss_data_interpolation.miss_ratios(trace_counter, load_miss_ratios)
+		interpolated_store_miss_ratios = ss_data_interpolation.miss_ratios(trace_counter, store_miss_ratios)
 
 		# trace_load_miss_ratios should already be aligned with the window boundaries of our instruction based samplers
 		trace_load_miss_ratios = ss_trace.calculate_PC_miss_ratios(cache_sizes, trace_sd_hist, cacheline_size)
 
 		# calculate instruction miss ratios
 		instr_miss_ratios = ss_instr.calculate_sample_miss_ratios(cache_sizes, instr_sd_hist, cacheline_size)
-		interpolated_instr_miss_ratios = ss_instr.interpolate_miss_ratios(window_instr, instr_bursts, instr_miss_ratios)
+		interpolated_instr_miss_ratios = ss_instr_interpolation.miss_ratios(trace_counter, instr_miss_ratios)
 
 		# calculate the number DRAM accesses
 		LLC_load_misses = interpolated_load_miss_ratios[config.get_LLC_size()][0] * interpolated_load_miss_ratios[config.get_LLC_size()][1]
@@ -248,8 +241,8 @@ def calculate_model(benchmark, constants, config):
 		# calculate cache component	#
 		#############################
 		# gather necessary variables
-		L1D_load_hits = ss_data_load.interpolate_L1_hits(window_instr, data_load_bursts, load_miss_ratios[cache_sizes[0]])
-		L1D_store_hits = ss_data_store.interpolate_L1_hits(window_instr, data_store_bursts, store_miss_ratios[cache_sizes[0]])
+		L1D_load_hits = ss_data_interpolation.hits(trace_counter, load_miss_ratios[cache_sizes[0]])
+		L1D_store_hits = ss_data_interpolation.hits(trace_counter, store_miss_ratios[cache_sizes[0]])
 		load_misses, store_misses, instr_misses = {}, {}, {}
 		for cache_size in cache_sizes:
 			load_misses[cache_size] = interpolated_load_miss_ratios[cache_size][0] * interpolated_load_miss_ratios[cache_size][1]
@@ -360,6 +353,10 @@ def calculate_model(benchmark, constants, config):
 
 		trace_counter += 1
 
+	# all windows were processed, the stack distance histograms written by statstack are complete now
+	close_statstacks([ss_data, ss_trace, ss_instr])
+	data_reader.close()
+
 	global_strides, global_no_strides, global_random_strides, global_randomly_placed_misses, global_ss_misses = mlp_model.get_overall_stats()
 
 	results_printer = Results_Printer(constants.input_dir, constants.output_dir, benchmark)
@@ -393,6 +390,44 @@ def calculate_model(benchmark, constants, config):
 
 	progress_printer.close_log_file()
 
+# only run statstack and store the miss ratio curve of every burst (and PC) with what is needed to interpolate them per window
+def calculate_miss_ratio_curves(benchmark, constants, config):
+	input_root = os.path.join(constants.input_dir, benchmark)
+	# statstack reads its own sample files, only the metadata and window bounds are needed
+	data_reader = Data_Reader(input_root, config, constants.read_ahead, log_only = True)
+	profiler_metadata, phase_bounds, window_bounds = data_reader.get_log_contents()
+
+	output_root = os.path.join(constants.output_dir, benchmark)
+	if not os.path.exists(output_root):
+		os.makedirs(output_root)
+	progress_printer = Progress_Printer(len(window_bounds), log_file=os.path.join(output_root, "log.out"))
+
+	progress_printer.print_message("Executing preliminary Statstack work:")
+	ss_data = Statstack(constants, benchmark, "data", "new", "sample", "data", profiler_metadata, progress_printer)
+	ss_trace = Statstack(constants, benchmark, "trace", "new", "trace", "data", profiler_metadata, progress_printer)
+	ss_instr = Statstack(constants, benchmark, "instr", "new", "sample", "instr", profiler_metadata, progress_printer)
+
+	curves = Miss_Ratio_Curves(window_bounds)
+	curves.add_source("load", ss_data, ss_data.align_bursts_windows(window_bounds))
+	curves.add_source("store", ss_data, ss_data.align_bursts_windows(window_bounds))
+	curves.add_source("instr", ss_instr, ss_instr.align_bursts_windows(window_bounds))
+	start_sdist_pool(constants, [ss_data, ss_trace, ss_instr])
+
+	progress_printer.setup_progressbar(message = "\nCalculating miss ratio curves:")
+	for trace_counter in range(len(window_bounds)):
+		progress_printer.print_progress(trace_counter)
+
+		curves.add_sd_hists("load", ss_data.get_sd_hists(_type='r', bursts = curves.sources["load"]["aligned_bursts"][trace_counter]))
+		curves.add_sd_hists("store", ss_data.get_sd_hists(_type='w', bursts = curves.sources["store"]["aligned_bursts"][trace_counter]))
+		curves.add_trace_sd_hists(ss_trace.get_sd_hists(_type='r', bursts = [trace_counter]))
+		curves.add_sd_hists("instr", ss_instr.get_sd_hists(_type='r', bursts = curves.sources["instr"]["aligned_bursts"][trace_counter]))
+
+	close_statstacks([ss_data, ss_trace, ss_instr])
+
+	curves.save(os.path.join(output_root, "miss_ratio_curves.pickle"))
+
+	progress_printer.close_log_file()
+
 def main():
 	global lock, completed
 
@@ -410,18 +445,14 @@ def main():
 
 	# no benchmarks were supplied, use all subdirectories in the input directory
 	if constants.benchmarks == []:
-		constants.benchmarks = os.listdir(constants.input_dir)
-		# do ignore the sd_hists_new and sd_hist_old dir
-		if "sd_hists_new" in constants.benchmarks:
-			constants.benchmarks.remove("sd_hists_new")
-		if "sd_hists_old" in constants.benchmarks:
-			constants.benchmarks.remove("sd_hists_old")
-		constants.benchmarks = sorted(constants.benchmarks, key=lambda s: s.lower())
+		constants.benchmarks = statstack_options.find_benchmarks(constants.input_dir)
+
+	benchmark_function = calculate_miss_ratio_curves if constants.miss_ratio_curves else calculate_model
 
 	# NON-PARALLEL
 	if constants.parallel == 1:
 		for benchmark in constants.benchmarks:
-			calculate_model(benchmark, constants, config)
+			benchmark_function(benchmark, constants, config)
 	# PARALLEL
 	else:
 		lock = Lock()
@@ -431,7 +462,7 @@ def main():
 
 		process_pool = Pool(constants.parallel, signal_handler)
 		for benchmark in constants.benchmarks:
-			process_pool.apply_async(calculate_model, args=(benchmark, constants, config), callback=set_completed)
+			process_pool.apply_async(benchmark_function, args=(benchmark, constants, config), callback=set_completed)
 
 		try:
 			while completed < len(constants.benchmarks):
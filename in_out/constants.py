@@ -30,9 +30,30 @@ class Constants:
 		self.mlp_model = "stride"
 
 		self.statstack = "new"
+		# number of processes used to build the reuse distance histograms of a benchmark (one sample file per process) and to map the bursts of a window to stack distances
+		self.statstack_processes = 1
+		# convert the StatStack sample files once to memory-mapped numpy columns (stored in <input_dir>/sample_columns) and read those
+		self.sample_columns = False
+		# zlib compress the blocks of the stack distance histogram files written by statstack
+		self.compress_sd_hists = False
+		# root of the stack distance histogram and sample column caches, None uses the input directory
+		self.cache_dir = None
+		# memory budget (in MB) of the rdist -> sdist mappings that statstack keeps, split over the statstack processes that map bursts, 0 disables the cache
+		self.mapping_cache_size = 256
+		# memory cap (in MB) of the reuse distance histograms of a statstack, histograms of bursts that are out of reach are released, 0 keeps all of them in memory
+		self.statstack_memory = 0
+		# spill reuse distance histograms to disk (in <cache_dir>/rdist_spill) to stay within statstack_memory, without spilling the cap is best effort
+		self.spill_rdist_hists = False
+		# keep only this many most significant bits of every stack distance (HDR histogram style buckets), 0 keeps them exact
+		self.sd_hist_precision = 0
+		# only compute and store the miss ratio curves of every window instead of the complete model
+		self.miss_ratio_curves = False
 
 		self.parallel = 1
 
+		# number of batches a background thread may decompress and frame ahead of the model, 0 disables read-ahead
+		self.read_ahead = 0
+
 		self.overwrite_config_parameters = {}
 
 		self.queue_model = "MLP"
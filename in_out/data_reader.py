@@ -19,11 +19,16 @@
 #  Copyright: 2016, Ghent University
 
 import os, sys, pdb, glob
-from aif_lib import Stream_Reader
+from aif_lib import Stream_Reader, Field_Filter, branch_file_pb2
+
+# the local, global and tournament entropy windows are saved subsequently, every window has one message of each type
+ENTROPY_TYPES = 3
 
 class Data_Reader():
-	def __init__(self, input_root, config):
+	# with log_only, only the metadata and bounds in the log are read, the model input streams are opened by open_streams()
+	def __init__(self, input_root, config, read_ahead = 0, log_only = False):
 		self.input_root = input_root
+		self.read_ahead = read_ahead
 		self.ROB_size = config.get_ROB_size()
 		self.cacheblock_size = config.get_cacheline_size()
 		self.entropy_type = config.get_entropy_type()
@@ -32,12 +37,25 @@ class Data_Reader():
 
 		self.read_metadata()
 		self.read_phase_window_bounds()
+		# the streams are closed by close(), the model usually stops reading them before the end of the files
+		self.readers = []
+		if log_only:
+			return
+
+		self.open_streams()
 
+	# the streams of the model input, read ahead by threads if read_ahead > 0
+	def open_streams(self):
 		self.create_utrace_generator()
 		self.create_entropy_generator()
 		self.create_MLP_generator()
 		self.create_cold_generator()
 
+	def close(self):
+		for reader in self.readers:
+			reader.close()
+		self.readers = []
+
 	def get_log_contents(self):
 		return self.profiler_metadata, self.phase_bounds, self.window_bounds
 
@@ -118,7 +136,8 @@ class Data_Reader():
 				if "utrace." in f:
 					utrace_files.append(os.path.join(root, f))
 
-		utrace_reader = Stream_Reader(utrace_files, "UTRACE", self.compressed)
+		utrace_reader = Stream_Reader(utrace_files, "UTRACE", self.compressed, read_ahead = self.read_ahead)
+		self.readers.append(utrace_reader)
 
 		# this protobuf file contains one message at the start detailing the used uop categories, read this first, then construct a generator for the other uTrace-messages
 		uop_string = utrace_reader.read_message()
@@ -137,9 +156,11 @@ class Data_Reader():
 				if "entropy." in f:
 					entropy_files.append(os.path.join(root, f))
 
-		entropy_reader = Stream_Reader(entropy_files, "BRANCH", self.compressed)
-
-		self.gen_entropy = entropy_reader.iter_in_place()
+		self.entropy_reader = Stream_Reader(entropy_files, "BRANCH", self.compressed, read_ahead = self.read_ahead)
+		self.readers.append(self.entropy_reader)
+		# the windows of the other types are skipped without decoding them
+		self.entropy_filter = Field_Filter((1,), [self.entropy_type], "")
+		self.entropy_window = branch_file_pb2.Entropy_Window()
 
 	def create_MLP_generator(self):
 		mlp_files = []
@@ -148,7 +169,8 @@ class Data_Reader():
 				if "mlp." in f:
 					mlp_files.append(os.path.join(root, f))
 
-		mlp_reader = Stream_Reader(mlp_files, "MLP", self.compressed)
+		mlp_reader = Stream_Reader(mlp_files, "MLP", self.compressed, read_ahead = self.read_ahead)
+		self.readers.append(mlp_reader)
 
 		self.gen_mlp = mlp_reader.iter_in_place()
 
@@ -159,7 +181,8 @@ class Data_Reader():
 				if "cold_misses." in f:
 					cold_files.append(os.path.join(root, f))
 
-		cold_reader = Stream_Reader(cold_files, "COLD", self.compressed)
+		cold_reader = Stream_Reader(cold_files, "COLD", self.compressed, read_ahead = self.read_ahead)
+		self.readers.append(cold_reader)
 
 		self.gen_cold = cold_reader.iter_in_place()
 
@@ -179,20 +202,22 @@ class Data_Reader():
 		return stats, dependences, uop_hist
 
 	def read_next_entropy_window(self):
-		entropy_window = next(self.gen_entropy)
-
-		# we have to check up to three different windows, because the local, global and tour window are saved subsequently
-		if entropy_window.type != self.entropy_type:
-			entropy_window = next(self.gen_entropy)
-			if entropy_window.type != self.entropy_type:
-				entropy_window = next(self.gen_entropy)
-
-		branches = entropy_window.branches
-
-		if entropy_window.type != self.entropy_type:
+		# the needed type is one of the next ENTROPY_TYPES messages, otherwise the windows would shift and take the data of the next window
+		entropy_window = None
+		for i in range(ENTROPY_TYPES):
+			data = self.entropy_reader.read_raw()
+			if data is None:
+				break
+			if self.entropy_filter.accepts(bytearray(data), 0, len(data)):
+				entropy_window = self.entropy_window
+				entropy_window.ParseFromString(data)
+				break
+		if entropy_window is None:
 			print "Needed entropy type was not found in file!"
 			sys.exit(1)
 
+		branches = entropy_window.branches
+
 		for ip in entropy_window.ips:
 			if ip.bits == self.IP_bits:
 				for bhr,entropy in zip(ip.bhr_bits, ip.entropy):
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+
+#  This file is part of the program: Processor Modeling Tool (PMT).
+#
+#  PMT is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  PMT is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with PMT.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  Authors: Sam Van den Steen, Ghent University
+#  Copyright: 2016, Ghent University
+
+import os
+
+# command line options of both evaluate_model.py and precompute_statstack.py, the scripts add their own options to these
+SHORT_OPTIONS = "c:i:o:b:p:a:h"
+LONG_OPTIONS = ['config=', 'input=', 'output=', 'benchmarks=', 'parallel=', 'argument=', 'read-ahead=', 'statstack-processes=', 'sample-columns', 'compress-sd-hists', 'cache-dir=', 'mapping-cache=', 'statstack-memory=', 'spill-rdist-hists', 'sd-hist-precision=', 'help']
+
+# directories in the input (or cache) directory that are not benchmarks
+CACHE_DIRS = ["sd_hists_new", "sd_hists_old", "sample_columns", "digests", "rdist_spill"]
+
+# all subdirectories of the input directory that hold a benchmark
+def find_benchmarks(input_dir):
+	benchmarks = [b for b in os.listdir(input_dir) if os.path.isdir(os.path.join(input_dir, b)) and b not in CACHE_DIRS]
+	return sorted(benchmarks, key=lambda s: s.lower())
+
+def usage():
+	print "--read-ahead number of message batches a background thread decompresses ahead of the model per input stream\n\tDEFAULT: 0 (disabled)"
+	print "--statstack-processes number of processes used to build the reuse distance histograms of a benchmark and to map the bursts of a window to stack distances (ignored when benchmarks run in parallel)\n\tDEFAULT: 1"
+	print "--sample-columns convert the StatStack sample files once to memory-mapped numpy columns and read those on later runs\n\tDEFAULT: disabled (no argument needed, using the flag => columns enabled)"
+	print "--compress-sd-hists zlib compress the stack distance histograms cached by statstack\n\tDEFAULT: disabled (no argument needed, using the flag => compression enabled)"
+	print "--cache-dir directory in which the stack distance histograms and sample columns are cached, can be shared by concurrent runs\n\tDEFAULT: the input directory"
+	print "--mapping-cache memory budget in MB of the reuse to stack distance mappings cached by statstack, split over the --statstack-processes that map bursts, 0 disables the cache\n\tDEFAULT: 256"
+	print "--statstack-memory memory cap in MB of the reuse distance histograms of a statstack, histograms of bursts that no later burst can reach are released, the others are spilled with --spill-rdist-hists, without spilling the cap is best effort\n\tDEFAULT: 0 (all histograms stay in memory)"
+	print "--spill-rdist-hists spill reuse distance histograms to the cache directory to stay within --statstack-memory\n\tDEFAULT: disabled (no argument needed, using the flag => spilling enabled)"
+	print "--sd-hist-precision number of most significant bits kept of every stack distance, larger distances are rounded down to buckets with a relative error below 2^-bits\n\tDEFAULT: 0 (exact stack distances)"
+
+# apply one of the shared options (except help) to constants, returns False for the options of the script itself
+def parse_option(constants, o, a):
+	if o in ("-c", "--config"):
+		constants.processor_config = a
+	elif o in ("-i", "--input"):
+		constants.input_dir = os.path.abspath(os.path.join(constants.top_level_dir, a))
+	elif o in ("-o", "--output"):
+		constants.output_dir = os.path.abspath(os.path.join(constants.top_level_dir, a))
+	elif o in ("-b", "--benchmarks"):
+		constants.benchmarks = a.split(",")
+	elif o in ("-p", "--parallel"):
+		constants.parallel = int(a)
+	elif o in ("-a", "--argument"):
+		# format is always:
+		# structure/parameter=value
+		structure = a.split('/')[0]
+		parameter_value = a.split('/')[1]
+		if not structure in constants.overwrite_config_parameters:
+			constants.overwrite_config_parameters[structure] = {}
+		constants.overwrite_config_parameters[structure][parameter_value.split("=")[0]] = parameter_value.split("=")[1]
+	elif o == "--read-ahead":
+		constants.read_ahead = int(a)
+	elif o == "--statstack-processes":
+		constants.statstack_processes = int(a)
+	elif o == "--sample-columns":
+		constants.sample_columns = True
+	elif o == "--compress-sd-hists":
+		constants.compress_sd_hists = True
+	elif o == "--cache-dir":
+		constants.cache_dir = os.path.abspath(os.path.join(constants.top_level_dir, a))
+	elif o == "--mapping-cache":
+		constants.mapping_cache_size = int(a)
+	elif o == "--statstack-memory":
+		constants.statstack_memory = int(a)
+	elif o == "--spill-rdist-hists":
+		constants.spill_rdist_hists = True
+	elif o == "--sd-hist-precision":
+		constants.sd_hist_precision = int(a)
+	else:
+		return False
+	return True
@@ -16,7 +16,7 @@
 #  Authors: Sam Van den Steen, Ghent University
 #  Copyright: 2016, Ghent University
 
-from statstack import Statstack
+from statstack import Statstack, Miss_Ratio_Curves, load_miss_ratio_curves, start_sdist_pool, close_statstacks
 from base_model import Base_Model
 from branch_model import Branch_Model
 from cache_model import Cache_Model
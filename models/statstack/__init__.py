@@ -17,4 +17,5 @@
 #			Andreas Sandberg, Uppsala University
 #  Copyright: 2016, Moncef Mechri and Andreas Sandberg
 
-from statstack import Statstack
+from statstack import Statstack, start_sdist_pool, close_statstacks
+from miss_ratio_curves import Miss_Ratio_Curves, load_miss_ratio_curves
@@ -0,0 +1,370 @@
+#  This file is part of the program: Processor Modeling Tool (PMT).
+#
+#  PMT is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  PMT is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with PMT.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  Authors: Sam Van den Steen, Ghent University
+#  Copyright: 2016, Ghent University
+
+import os, sys, bisect, numpy
+from collections import OrderedDict
+from aif_lib import Distance_Hist
+
+# largest number of (rdist, count) pairs per block of a Streaming_Burst_Hists, whatever its memory cap
+BLOCK_PAIRS = 256 * 1024
+# the rdist index of a Burst_Hists is built for the first range of at least this many pairs, merging smaller ranges is cheap anyway
+INDEX_RANGE_PAIRS = 64 * 1024
+# bytes of a pair in a block, its burst, rdist and count are int64
+PAIR_BYTES = 24
+# the blocks of a Streaming_Burst_Hists are sized so that this many of them fit within its memory cap
+BLOCKS_PER_CAP = 8
+
+# sum the counts of identical keys, keys and counts have to be sorted by key already
+def reduce_sorted(keys, counts):
+	if len(keys) == 0:
+		return keys, counts
+	first_of_key = numpy.ones(len(keys), dtype = bool)
+	first_of_key[1:] = keys[1:] != keys[:-1]
+	starts = numpy.flatnonzero(first_of_key)
+	return keys[starts], numpy.add.reduceat(counts, starts)
+
+# group (burst, rdist) pairs into (burst, rdist, count) triples sorted by burst and rdist, if counts is None every pair counts once
+def group_pairs(bursts, rdists, counts = None):
+	bursts = numpy.asarray(bursts, dtype = numpy.int64)
+	rdists = numpy.asarray(rdists, dtype = numpy.int64)
+	if counts is None:
+		counts = numpy.ones(len(bursts), dtype = numpy.int64)
+	if len(bursts) == 0:
+		return bursts, rdists, numpy.asarray(counts, dtype = numpy.int64)
+
+	order = numpy.lexsort((rdists, bursts))
+	bursts, rdists, counts = bursts[order], rdists[order], numpy.asarray(counts, dtype = numpy.int64)[order]
+	first_of_pair = numpy.ones(len(order), dtype = bool)
+	first_of_pair[1:] = (bursts[1:] != bursts[:-1]) | (rdists[1:] != rdists[:-1])
+	starts = numpy.flatnonzero(first_of_pair)
+
+	return bursts[starts], rdists[starts], numpy.add.reduceat(counts, starts)
+
+# Reuse distance histograms of all bursts, stored as one array of (rdist, count) pairs sorted by burst and rdist
+# The pairs of burst_ids[i] are rdists[offsets[i]:offsets[i + 1]] and counts[offsets[i]:offsets[i + 1]]
+class Burst_Hists(object):
+	def __init__(self, bursts, rdists, counts):
+		# bursts, rdists and counts are triples as returned by group_pairs
+		self.burst_ids, first = numpy.unique(bursts, return_index = True)
+		self.offsets = numpy.append(first, len(bursts)).astype(numpy.int64)
+		self.rdists = rdists
+		self.counts = counts
+		# prefix sums of the counts in burst order, the number of samples of any burst range is a difference of two entries
+		self.cum_counts = numpy.append(0, numpy.cumsum(counts)).astype(numpy.int64)
+		# the rdist index is only built when a range is large enough to use it, or a burst with an rdist is searched
+		self.key_rdists = None
+
+	def __len__(self):
+		return len(self.burst_ids)
+
+	def __contains__(self, burst):
+		i = numpy.searchsorted(self.burst_ids, burst)
+		return i < len(self.burst_ids) and self.burst_ids[i] == burst
+
+	def bursts(self):
+		return self.burst_ids.tolist()
+
+	# index range in rdists and counts of the bursts from first to last (both included)
+	def pair_range(self, first, last):
+		lo = numpy.searchsorted(self.burst_ids, first, 'left')
+		hi = numpy.searchsorted(self.burst_ids, last, 'right')
+		return self.offsets[lo], self.offsets[hi], hi - lo
+
+	def hist(self, burst):
+		begin, end, no_bursts = self.pair_range(burst, burst)
+		return self.rdists[begin:end], self.counts[begin:end]
+
+	# histogram of all bursts from first to last (both included) as sorted rdist and count arrays
+	def range_hist(self, first, last):
+		begin, end, no_bursts = self.pair_range(first, last)
+		rdists, counts = self.rdists[begin:end], self.counts[begin:end]
+		if no_bursts <= 1:
+			return rdists, counts
+
+		# large ranges are a difference of the prefix sums of every rdist, which costs a lookup per distinct rdist of all bursts
+		# instead of sorting the pairs of the range
+		if end - begin >= INDEX_RANGE_PAIRS:
+			if self.key_rdists is None:
+				self.build_rdist_index()
+			if end - begin > len(self.key_rdists):
+				return self.range_hist_prefix(first, last)
+		order = numpy.argsort(rdists, kind = 'mergesort')
+		return reduce_sorted(rdists[order], counts[order])
+
+	def range_hist_prefix(self, first, last):
+		if self.key_rdists is None:
+			self.build_rdist_index()
+		ranks = numpy.arange(len(self.key_rdists), dtype = numpy.int64) * self.burst_scale
+		lo = numpy.searchsorted(self.index_keys, ranks + max(first, 0), 'left')
+		hi = numpy.searchsorted(self.index_keys, ranks + min(last, self.burst_scale - 1), 'right')
+		counts = self.index_cum_counts[hi] - self.index_cum_counts[lo]
+		present = counts > 0
+		return self.key_rdists[present], counts[present]
+
+	def counter(self, burst):
+		rdists, counts = self.hist(burst)
+		return Distance_Hist(rdists, counts)
+
+	def range_counter(self, first, last):
+		rdists, counts = self.range_hist(first, last)
+		return Distance_Hist(rdists, counts)
+
+	# Index of the pairs sorted by rdist and burst, with prefix sums of the counts in that order
+	# The bursts that contain key_rdists[k] are index_bursts[key_starts[k]:key_starts[k + 1]]
+	def build_rdist_index(self):
+		pair_bursts = numpy.repeat(self.burst_ids, numpy.diff(self.offsets))
+		order = numpy.lexsort((pair_bursts, self.rdists))
+		index_rdists = self.rdists[order]
+		self.index_bursts = pair_bursts[order]
+		self.index_cum_counts = numpy.append(0, numpy.cumsum(self.counts[order])).astype(numpy.int64)
+		self.key_rdists, key_starts = numpy.unique(index_rdists, return_index = True)
+		self.key_starts = numpy.append(key_starts, len(order)).astype(numpy.int64)
+
+		# (rank of the rdist, burst) as a single sorted integer, so a burst range can be looked up for all rdists at once
+		self.burst_scale = int(self.burst_ids[-1]) + 1 if len(self.burst_ids) > 0 else 1
+		key_ranks = numpy.repeat(numpy.arange(len(self.key_rdists), dtype = numpy.int64), numpy.diff(self.key_starts))
+		self.index_keys = key_ranks * self.burst_scale + self.index_bursts
+
+	# every burst stays available
+	def oldest_available_burst(self):
+		return 0
+
+	def total(self, first, last):
+		begin, end, no_bursts = self.pair_range(first, last)
+		return self.cum_counts[end] - self.cum_counts[begin]
+
+	# the closest burst before the given burst that contains rdist, -1 if there is none
+	def last_burst_with(self, rdist, before):
+		if self.key_rdists is None:
+			self.build_rdist_index()
+		k = numpy.searchsorted(self.key_rdists, rdist)
+		if k == len(self.key_rdists) or self.key_rdists[k] != rdist:
+			return -1
+		bursts = self.index_bursts[self.key_starts[k]:self.key_starts[k + 1]]
+		i = numpy.searchsorted(bursts, before, 'left')
+		if i == 0:
+			return -1
+		return int(bursts[i - 1])
+
+# Collects (burst, rdist) pairs chunk by chunk, every chunk is grouped immediately so only the distinct pairs are kept in memory
+# With a spill directory, the chunks are merged and written to disk whenever they take more than half of the memory cap
+class Burst_Hists_Builder(object):
+	def __init__(self, spill_dir = None, memory_cap = 0):
+		self.bursts, self.rdists, self.counts = [], [], []
+		self.size = 0
+		self.spill_dir = spill_dir
+		self.memory_cap = memory_cap
+		# memory-mapped (bursts, rdists, counts) rows of the chunks written to spill_dir
+		self.spilled_chunks = []
+
+	def add_pairs(self, bursts, rdists):
+		self.add_chunk(*group_pairs(bursts, rdists))
+
+	def add_hists(self, burst_hists):
+		self.add_chunk(numpy.repeat(burst_hists.burst_ids, numpy.diff(burst_hists.offsets)), burst_hists.rdists, burst_hists.counts)
+
+	def add_chunk(self, bursts, rdists, counts):
+		self.bursts.append(bursts)
+		self.rdists.append(rdists)
+		self.counts.append(counts)
+		self.size += bursts.nbytes + rdists.nbytes + counts.nbytes
+		if self.spill_dir != None and self.memory_cap > 0 and self.size > self.memory_cap / 2:
+			self.spill_chunks()
+
+	def spill_chunks(self):
+		chunk = numpy.array(group_pairs(numpy.concatenate(self.bursts), numpy.concatenate(self.rdists), numpy.concatenate(self.counts)))
+		file_name = os.path.join(self.spill_dir, "chunk_%d.npy" % (len(self.spilled_chunks)))
+		numpy.save(file_name, chunk)
+		self.spilled_chunks.append(numpy.load(file_name, mmap_mode = 'r'))
+		self.bursts, self.rdists, self.counts = [], [], []
+		self.size = 0
+
+	# all chunks as (bursts, rdists, counts) triples sorted by burst
+	def chunks(self):
+		return zip(self.bursts, self.rdists, self.counts) + [(chunk[0], chunk[1], chunk[2]) for chunk in self.spilled_chunks]
+
+	def build(self):
+		chunks = self.chunks()
+		if len(chunks) == 0:
+			empty = numpy.zeros(0, dtype = numpy.int64)
+			return Burst_Hists(empty, empty, empty)
+		if len(chunks) == 1 and len(self.spilled_chunks) == 0:
+			return Burst_Hists(*chunks[0])
+
+		return Burst_Hists(*group_pairs(*[numpy.concatenate(column) for column in zip(*chunks)]))
+
+	# build a Streaming_Burst_Hists block by block, only the pairs of one range of bursts are merged at a time
+	# without block_pairs, the blocks are sized after the memory cap
+	def build_streaming(self, memory_cap, spill_dir = None, block_pairs = None):
+		hists = Streaming_Burst_Hists(memory_cap, spill_dir)
+		chunks = [chunk for chunk in self.chunks() if len(chunk[0]) > 0]
+		if len(chunks) == 0:
+			return hists
+		if block_pairs == None:
+			block_pairs = max(1, min(BLOCK_PAIRS, memory_cap / (BLOCKS_PER_CAP * PAIR_BYTES)))
+
+		first_burst = min([int(chunk[0][0]) for chunk in chunks])
+		last_burst = max([int(chunk[0][-1]) for chunk in chunks])
+		# the number of distinct pairs of every burst (a pair is in a single chunk after merging), a block ends before it would exceed block_pairs
+		# bursts are never split, so a block of a single burst can still be larger
+		burst_pairs = numpy.zeros(last_burst - first_burst + 1, dtype = numpy.int64)
+		for bursts, rdists, counts in chunks:
+			burst_pairs += numpy.bincount(bursts - first_burst, minlength = len(burst_pairs))
+		cum_pairs = numpy.cumsum(burst_pairs)
+
+		first = 0
+		while first < len(burst_pairs):
+			pairs_before = cum_pairs[first - 1] if first > 0 else 0
+			last = max(first, int(numpy.searchsorted(cum_pairs, pairs_before + block_pairs, 'right')) - 1)
+			parts = []
+			for bursts, rdists, counts in chunks:
+				begin, end = numpy.searchsorted(bursts, first_burst + first, 'left'), numpy.searchsorted(bursts, first_burst + last, 'right')
+				if end > begin:
+					parts.append((bursts[begin:end], rdists[begin:end], counts[begin:end]))
+			if len(parts) > 0:
+				hists.add_block(*group_pairs(*[numpy.concatenate(column) for column in zip(*parts)]))
+			first = last + 1
+
+		self.bursts, self.rdists, self.counts, self.spilled_chunks = [], [], [], []
+		self.size = 0
+		return hists
+
+# Reuse distance histograms of all bursts for a streaming StatStack, split in blocks of consecutive bursts. Landing bursts
+# are processed in order, so blocks of bursts before the oldest takeoff burst of the current landing burst are released.
+# Other blocks are only evicted when the memory cap is exceeded, the blocks furthest ahead first. Evicted blocks are spilled
+# to disk and loaded again when needed if there is a spill directory. Without one, only released blocks are evicted and
+# they are dropped, so the memory cap is best effort: it only bounds the memory if the released blocks are enough.
+# A block that is larger than the memory cap on its own exceeds it while it is in memory, these are counted as oversized.
+class Streaming_Burst_Hists(object):
+	def __init__(self, memory_cap, spill_dir = None):
+		self.memory_cap = memory_cap
+		self.spill_dir = spill_dir
+		# first and last burst and the range of finite rdists of every block, in burst order
+		self.block_first, self.block_last, self.block_min_rdist, self.block_max_rdist = [], [], [], []
+		# (bursts, rdists, counts) of the blocks in memory, least recently used first
+		self.blocks = OrderedDict()
+		self.size = 0
+		self.spilled = set()
+		# number of leading blocks that were dropped
+		self.dropped = 0
+		# the highest block of the last range
+		self.position = 0
+		# the largest finite rdist of all bursts, it bounds how far back a vicinity can reach
+		self.max_rdist = 0
+		self.peak_size, self.evictions, self.reloads = 0, 0, 0
+		self.oversized_blocks = 0
+
+	def add_block(self, bursts, rdists, counts):
+		block = len(self.block_first)
+		self.block_first.append(int(bursts[0]))
+		self.block_last.append(int(bursts[-1]))
+		finite = rdists[rdists != sys.maxint]
+		self.block_min_rdist.append(int(finite.min()) if len(finite) > 0 else sys.maxint)
+		self.block_max_rdist.append(int(finite.max()) if len(finite) > 0 else -1)
+		self.max_rdist = max(self.max_rdist, self.block_max_rdist[-1])
+		if bursts.nbytes + rdists.nbytes + counts.nbytes > self.memory_cap:
+			self.oversized_blocks += 1
+		self.insert(block, (bursts, rdists, counts))
+
+	def insert(self, block, arrays):
+		block_size = sum([a.nbytes for a in arrays])
+		# room is made before the block is added, so the cap also holds while a block is loaded
+		while self.spill_dir != None and self.size + block_size > self.memory_cap and len(self.blocks) > 0:
+			ahead = [b for b in self.blocks if b > self.position]
+			if len(ahead) > 0:
+				self.evict(max(ahead))
+			else:
+				self.evict(next(iter(self.blocks)))
+
+		self.blocks[block] = arrays
+		self.size += block_size
+		self.peak_size = max(self.peak_size, self.size)
+
+	def block_file(self, block):
+		return os.path.join(self.spill_dir, "block_%d.npy" % (block))
+
+	def evict(self, block):
+		arrays = self.blocks.pop(block)
+		self.size -= sum([a.nbytes for a in arrays])
+		self.evictions += 1
+		if self.spill_dir != None and block not in self.spilled:
+			numpy.save(self.block_file(block), numpy.array(arrays))
+			self.spilled.add(block)
+
+	# (bursts, rdists, counts) of a block, None if it was dropped
+	def get_block(self, block):
+		if block in self.blocks:
+			arrays = self.blocks.pop(block)
+			self.blocks[block] = arrays
+			return arrays
+		if block in self.spilled:
+			self.reloads += 1
+			spilled = numpy.load(self.block_file(block))
+			arrays = (spilled[0], spilled[1], spilled[2])
+			self.insert(block, arrays)
+			return arrays
+		return None
+
+	# no later range starts before burst, the blocks before it are spilled or dropped
+	def release_before(self, burst):
+		for block in range(self.dropped, bisect.bisect_left(self.block_last, burst)):
+			if block in self.blocks:
+				self.evict(block)
+			if self.spill_dir == None:
+				self.dropped = block + 1
+
+	def oldest_available_burst(self):
+		if self.dropped == 0:
+			return 0
+		if self.dropped == len(self.block_first):
+			return self.block_last[-1] + 1
+		return self.block_first[self.dropped]
+
+	# histogram of all bursts from first to last (both included) as sorted rdist and count arrays
+	def range_hist(self, first, last):
+		lo, hi = bisect.bisect_left(self.block_last, first), bisect.bisect_right(self.block_first, last)
+		self.position = hi - 1
+
+		rdists, counts = [], []
+		for block in range(max(lo, self.dropped), hi):
+			bursts, block_rdists, block_counts = self.get_block(block)
+			begin, end = numpy.searchsorted(bursts, first, 'left'), numpy.searchsorted(bursts, last, 'right')
+			rdists.append(block_rdists[begin:end])
+			counts.append(block_counts[begin:end])
+		if len(rdists) == 0:
+			empty = numpy.zeros(0, dtype = numpy.int64)
+			return empty, empty
+
+		rdists, counts = numpy.concatenate(rdists), numpy.concatenate(counts)
+		order = numpy.argsort(rdists, kind = 'mergesort')
+		return reduce_sorted(rdists[order], counts[order])
+
+	# the closest burst before the given burst that contains rdist, -1 if there is none (in the available bursts)
+	def last_burst_with(self, rdist, before):
+		for block in reversed(range(self.dropped, bisect.bisect_left(self.block_first, before))):
+			if rdist < self.block_min_rdist[block] or rdist > self.block_max_rdist[block]:
+				continue
+			bursts, rdists, counts = self.get_block(block)
+			end = numpy.searchsorted(bursts, before, 'left')
+			found = numpy.flatnonzero(rdists[:end] == rdist)
+			if len(found) > 0:
+				return int(bursts[found[-1]])
+		return -1
+
+	def stats(self):
+		return "%d blocks (%d larger than the cap), %d in memory (%.1f MB, peak %.1f MB), %d evictions, %d spilled, %d reloaded, %d dropped" % (len(self.block_first), self.oversized_blocks, len(self.blocks), self.size / (1024.0 * 1024.0), self.peak_size / (1024.0 * 1024.0), self.evictions, len(self.spilled), self.reloads, self.dropped)
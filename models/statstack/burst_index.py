@@ -0,0 +1,52 @@
+#  This file is part of the program: Processor Modeling Tool (PMT).
+#
+#  PMT is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  PMT is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with PMT.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  Authors: Sam Van den Steen, Ghent University
+#  Copyright: 2016, Ghent University
+
+import numpy
+
+# Instruction ranges of all bursts as sorted begin and end arrays, bursts are looked up with searchsorted instead of scanning the burst edges
+class Burst_Index(object):
+	def __init__(self, burst_edges):
+		self.begins = numpy.array([edges[0] for edges in burst_edges], dtype = numpy.int64)
+		self.ends = numpy.array([edges[1] for edges in burst_edges], dtype = numpy.int64)
+		# the interpolation multiplies instruction counts, so it works on python ints that do not overflow
+		self.begin_list = self.begins.tolist()
+		self.end_list = self.ends.tolist()
+
+	def __len__(self):
+		return len(self.begin_list)
+
+	# first and last burst of every window: the last burst that begins at or before the window begins (never before the first burst of the previous window)
+	# up to the first burst that ends after the window ends, or only the first burst if there is no such burst
+	def window_ranges(self, window_bounds):
+		window_begins = numpy.array([wb[0] for wb in window_bounds], dtype = numpy.int64)
+		window_ends = numpy.array([wb[1] for wb in window_bounds], dtype = numpy.int64)
+
+		firsts = numpy.maximum(numpy.searchsorted(self.begins, window_begins, 'right') - 1, 0)
+		firsts = numpy.maximum.accumulate(firsts) if len(firsts) > 0 else firsts
+		lasts = numpy.maximum(numpy.searchsorted(self.ends, window_ends, 'right'), firsts)
+		lasts = numpy.where(lasts >= len(self.ends), firsts, lasts)
+		return firsts, lasts
+
+	# the bursts of every window as lists of burst ids
+	def align(self, window_bounds):
+		firsts, lasts = self.window_ranges(window_bounds)
+		return [range(first, last + 1) for first, last in zip(firsts.tolist(), lasts.tolist())]
+
+	# [begin, end] of every burst in bursts
+	def edges(self, bursts):
+		return [[self.begin_list[b], self.end_list[b]] for b in bursts]
@@ -0,0 +1,203 @@
+#  This file is part of the program: Processor Modeling Tool (PMT).
+#
+#  PMT is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  PMT is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with PMT.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  Authors: Sam Van den Steen, Ghent University
+#  Copyright: 2016, Ghent University
+
+import sys, heapq, array, numpy
+from collections import defaultdict, deque
+from aif_lib import Distance_Hist
+
+ACCESS_TYPES = {'r' : 0, 'w' : 1}
+
+class Landing_Events_Error(Exception):
+	pass
+
+# (burst, rdist, PC, access type) of the samples of the given access types, samples are reused by the readers so only these fields are kept
+# the burst is the one of the takeoff access for traces (their behaviour should be the same as the landing PC) and the landing access otherwise
+def sample_events(samples, access_types, takeoff):
+	for sample in samples:
+		access = sample.begin if takeoff else sample.end
+		if access.access_type in access_types:
+			yield access.burst_id, sample.end.access_counter - sample.begin.access_counter - 1, sample.begin.program_counter, access.access_type
+
+# dangling samples only have a takeoff access, they are cold misses (sys.maxint) of the takeoff burst
+# this is not ideal, because the access_type of a dangling sample might not match the access_type of the corresponding cold miss, but we can't really do better than this
+def dangling_events(samples, access_types):
+	for sample in samples:
+		if sample.begin.access_type in access_types:
+			yield sample.begin.burst_id, sys.maxint, sample.begin.program_counter, sample.begin.access_type
+
+# events of a sample reader, column readers compute them from whole chunks of columns
+def reader_events(reader, access_types, takeoff):
+	if hasattr(reader, "iter_events"):
+		return reader.iter_events(access_types, takeoff)
+	return sample_events(reader.iter_in_place(), access_types, takeoff)
+
+def reader_dangling_events(reader, access_types):
+	if hasattr(reader, "iter_dangling_events"):
+		return reader.iter_dangling_events(access_types)
+	return dangling_events(reader.iter_in_place(), access_types)
+
+# Per PC rdist histograms of one burst, kept as (PC, rdist) pairs so traces with many PCs stay compact
+class PC_Rdist_Hist(object):
+	def __init__(self):
+		# program counters are unsigned
+		self.PCs = array.array('L')
+		self.rdists = array.array('l')
+
+	def __len__(self):
+		return len(self.PCs)
+
+	def add(self, PC, rdist):
+		self.PCs.append(PC)
+		self.rdists.append(rdist)
+
+	# distinct (PC, rdist) pairs sorted by PC and rdist, with their counts
+	def grouped(self):
+		PCs = numpy.frombuffer(self.PCs, dtype = numpy.uint64) if len(self.PCs) > 0 else numpy.zeros(0, dtype = numpy.uint64)
+		rdists = numpy.frombuffer(self.rdists, dtype = numpy.int64) if len(self.rdists) > 0 else numpy.zeros(0, dtype = numpy.int64)
+		if len(PCs) == 0:
+			return PCs, rdists, numpy.zeros(0, dtype = numpy.int64)
+
+		order = numpy.lexsort((rdists, PCs))
+		PCs, rdists = PCs[order], rdists[order]
+		first_of_pair = numpy.ones(len(order), dtype = bool)
+		first_of_pair[1:] = (PCs[1:] != PCs[:-1]) | (rdists[1:] != rdists[:-1])
+		starts = numpy.flatnonzero(first_of_pair)
+		counts = numpy.diff(numpy.append(starts, len(order)))
+		return PCs[starts], rdists[starts], counts
+
+	# {PC: Distance_Hist of sdists}, every rdist is mapped with rdist_sdist, rdists that are not in it are left out
+	def sdist_hists(self, rdist_sdist, precision = None):
+		PC_sdist_hists = {}
+		PCs, rdists, counts = self.grouped()
+		if len(PCs) == 0 or len(rdist_sdist) == 0:
+			return PC_sdist_hists
+
+		keys = numpy.array(sorted(rdist_sdist), dtype = numpy.int64)
+		values = numpy.array([rdist_sdist[k] for k in keys.tolist()], dtype = numpy.int64)
+		index = numpy.minimum(numpy.searchsorted(keys, rdists), len(keys) - 1)
+		mapped = keys[index] == rdists
+		PCs, sdists, counts = PCs[mapped], values[index[mapped]], counts[mapped]
+		if len(PCs) == 0:
+			return PC_sdist_hists
+
+		# the pairs are still sorted by PC, different rdists of a PC can map to the same sdist but the histogram sums those
+		starts = numpy.flatnonzero(numpy.append(True, PCs[1:] != PCs[:-1]))
+		ends = numpy.append(starts[1:], len(PCs))
+		for PC, start, end in zip(PCs[starts].tolist(), starts.tolist(), ends.tolist()):
+			PC_sdist_hists[PC] = Distance_Hist(sdists[start:end], counts[start:end], precision = precision)
+
+		return PC_sdist_hists
+
+# Events of a source that is sorted by burst, the first event after a window is kept for the next window
+class Burst_Stream(object):
+	def __init__(self, events):
+		self.events = events
+		self.pending = None
+
+	# all (remaining) events of the bursts up to last
+	def take_until(self, last):
+		if self.pending is not None:
+			if self.pending[0] > last:
+				return
+			yield self.pending
+			self.pending = None
+
+		for event in self.events:
+			if event[0] > last:
+				self.pending = event
+				return
+			yield event
+
+# Categorizes the dangling, OoO and complete samples of a Statstack per window, for one or more access types in the same pass
+# The dangling samples and every OoO file are sorted by burst, they are merged into one stream and read up to the last burst of the window
+# The complete samples are read until all memops of the window are found, they are not sorted by the takeoff burst of traces
+# complete, every OoO reader and dangling are sample readers (Stream_Reader or Column_Reader)
+class Landing_Events(object):
+	def __init__(self, complete, ooo_list, dangling, _types, takeoff):
+		for _type in _types:
+			if _type not in ACCESS_TYPES:
+				raise ValueError("Landing events can only be categorized per access type ('r' or 'w'), not %s" % (_type))
+		self.types = list(_types)
+		access_types = [ACCESS_TYPES[_type] for _type in self.types]
+
+		self.per_PC = takeoff
+		self.sorted_streams = [Burst_Stream(reader_dangling_events(dangling, access_types))]
+		for ooo in ooo_list:
+			self.sorted_streams.append(Burst_Stream(reader_events(ooo, access_types, takeoff)))
+		self.complete = reader_events(complete, access_types, takeoff)
+		# complete samples of an access type that had all its memops while another type was still being read, in stream order
+		self.carried = deque()
+
+	def complete_events(self):
+		while self.carried:
+			yield self.carried.popleft()
+		for event in self.complete:
+			yield event
+
+	# per access type: the rdist histogram (and per PC rdist histograms for traces) of every burst in valid_bursts, plus the number of memops found in the sorted streams and the complete samples
+	# memops_to_find holds the number of memops of every access type
+	def categorize(self, valid_bursts, memops_to_find):
+		valid = set(valid_bursts)
+		rdist_hists, PC_rdist_hists, sorted_found, complete_found = {}, {}, {}, {}
+		for _type in self.types:
+			access_type = ACCESS_TYPES[_type]
+			rdist_hists[access_type] = defaultdict(Distance_Hist)
+			PC_rdist_hists[access_type] = defaultdict(PC_Rdist_Hist) if self.per_PC else None
+			sorted_found[access_type], complete_found[access_type] = 0, 0
+
+		for burst, rdist, PC, access_type in heapq.merge(*[stream.take_until(valid_bursts[-1]) for stream in self.sorted_streams]):
+			# samples of bursts before the window belong to bursts that were already calculated
+			if burst in valid:
+				rdist_hists[access_type][burst].add(rdist)
+				if self.per_PC:
+					PC_rdist_hists[access_type][burst].add(PC, rdist)
+				sorted_found[access_type] += 1
+
+		missing = dict((ACCESS_TYPES[_type], memops_to_find[_type] - sorted_found[ACCESS_TYPES[_type]]) for _type in self.types)
+		incomplete = len([m for m in missing.itervalues() if m > 0])
+		if incomplete > 0:
+			carried = deque()
+			# fast forward through warmup phases and samples of other bursts
+			for event in self.complete_events():
+				burst, rdist, PC, access_type = event
+				if missing[access_type] <= 0:
+					# a single access type would not have read this sample yet, so later bursts still need it
+					if burst > valid_bursts[-1]:
+						carried.append(event)
+					continue
+
+				if burst in valid:
+					rdist_hists[access_type][burst].add(rdist)
+					if self.per_PC:
+						PC_rdist_hists[access_type][burst].add(PC, rdist)
+					complete_found[access_type] += 1
+					missing[access_type] -= 1
+					if missing[access_type] == 0:
+						incomplete -= 1
+						if incomplete == 0:
+							break
+
+			# samples carried from earlier windows that were not read yet come after the ones carried now
+			carried.extend(self.carried)
+			self.carried = carried
+
+		results = {}
+		for _type in self.types:
+			access_type = ACCESS_TYPES[_type]
+			results[_type] = (rdist_hists[access_type], PC_rdist_hists[access_type], sorted_found[access_type], complete_found[access_type])
+		return results
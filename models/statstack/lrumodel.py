@@ -20,76 +20,91 @@
 #			Andreas Sandberg, Uppsala University
 #  Copyright: 2016, Ghent University
 
+import numpy
 import histogram, missratio
+from aif_lib import Distance_Hist
+from aif_lib.distance_hist import INFINITE
+
+# sorted key and value arrays of a Distance_Hist or a {rdist: count} dict, infinite rdists are sys.maxint
+def hist_arrays(hist):
+    if isinstance(hist, Distance_Hist):
+        return hist.all_arrays()
+    keys = numpy.array(sorted(hist), dtype = numpy.int64)
+    counts = numpy.array([hist[k] for k in keys.tolist()])
+    return keys, counts
+
+# stack distance of every rdist in the sorted rdists array, this is the recurrence of lru_sdist evaluated with cumulative sums
+def lru_sdist_arrays(rdists, counts, boundary = False):
+    if len(rdists) == 0:
+        return numpy.zeros(0)
+
+    # reverse cdf: the fraction of reuses with an rdist of at least this rdist, summed in the same order as histogram.Cdf
+    pdf = counts / float(numpy.sum(counts))
+    rcdf = 1.0 - numpy.concatenate(([0.0], numpy.cumsum(pdf[:-1])))
+
+    gaps, rcdf = numpy.diff(rdists), rcdf[1:]
+    if boundary:
+        # histogram.Pdf.__getitem__ returns 0 for every rdist in the histogram, so the boundary term rcdf / (1.0 - pdf) always was rcdf / 1.0
+        steps = (gaps - 1) * rcdf + rcdf
+    else:
+        steps = gaps * rcdf
+
+    return numpy.cumsum(numpy.concatenate(([float(rdists[0])], steps)))
 
 def lru_sdist(rdist_hist, boundary = False):
-    rdist_pdf   = histogram.Pdf(rdist_hist)
-    rdist_rcdf  = histogram.Cdf_r(rdist_hist)
-    rdist_sdist = {}
-
-    for rdist, rcdf in rdist_rcdf:
-        if len(rdist_sdist) == 0:
-            prev_rdist = rdist
-            prev_sdist = rdist
-            rdist_sdist[rdist] = rdist
-        else:
-            if boundary:
-                prev_sdist += (rdist - prev_rdist - 1) * rcdf + rcdf / (1.0 - rdist_pdf[prev_rdist])
-            else:
-                prev_sdist += (rdist - prev_rdist) * rcdf
-
-            prev_rdist = rdist
-            rdist_sdist[rdist] = prev_sdist
-
-    return rdist_sdist
+    rdists, counts = hist_arrays(rdist_hist)
+    return dict(zip(rdists.tolist(), lru_sdist_arrays(rdists, counts, boundary).tolist()))
+
+# map a whole rdist histogram to an sdist Distance_Hist, the counts of subtract_hist are removed per rdist
+def map_sdist_hist(rdist_hist, subtract_hist = None, boundary = False):
+    rdists, counts = hist_arrays(rdist_hist)
+    if len(rdists) == 0:
+        return Distance_Hist()
+
+    # python 2 rounds halfway cases away from zero, stack distances are never negative
+    # the sdists stay floats until the end, the sdist of a cold miss (sys.maxint) rounds to 2**63 which does not fit an int64
+    sdists = numpy.floor(lru_sdist_arrays(rdists, counts, boundary) + 0.5)
+    if subtract_hist:
+        counts = counts - numpy.array([subtract_hist.get(rdist, 0) for rdist in rdists.tolist()])
+
+    order = numpy.argsort(sdists, kind = 'mergesort')
+    sdists, counts = sdists[order], counts[order]
+    first_of_sdist = numpy.ones(len(sdists), dtype = bool)
+    first_of_sdist[1:] = sdists[1:] != sdists[:-1]
+    starts = numpy.flatnonzero(first_of_sdist)
+
+    sdists, counts = sdists[starts], numpy.add.reduceat(counts, starts)
+    # rdists with an infinite sdist (2**63 and up) are the cold misses
+    finite = sdists < float(INFINITE)
+    return Distance_Hist(sdists[finite].astype(numpy.int64), counts[finite], infinite = counts[~finite].sum())
+
+def subtracted_hist_name(_type):
+    if _type == 'rw':
+        return None
+    elif _type == 'r':
+        return 'wr_rdist_hist'
+    elif _type == 'w':
+        return 'rd_rdist_hist'
+    else:
+        raise Exception("Unknown sample type")
 
 def sdist_hist(rdist_histograms, _type='rw', boundary = False):
-    sdist_hist = {}
-
     #the mapping from reuse distances to stack distances is always built
     #from the full reuse distance histogram.
-    rdist_sdist_map = lru_sdist(rdist_histograms['rw_rdist_hist'], boundary)
+    name = subtracted_hist_name(_type)
+    subtract_hist = rdist_histograms[name] if name != None else None
 
-    for (rdist, count) in rdist_histograms['rw_rdist_hist'].items():
-        sdist = int(round(rdist_sdist_map[rdist]))
-        sdist_hist[sdist] = sdist_hist.get(sdist, 0) + count
-
-        if _type == 'rw':
-            pass
-        elif _type == 'r':
-            sdist_hist[sdist] -= rdist_histograms['wr_rdist_hist'].get(rdist, 0)
-        elif _type == 'w':
-            sdist_hist[sdist] -= rdist_histograms['rd_rdist_hist'].get(rdist, 0)
-        else:
-            raise Exception("Unknown sample type")
-
-    return sdist_hist
+    return map_sdist_hist(rdist_histograms['rw_rdist_hist'], subtract_hist, boundary)
 
 def sdist_hist_PC(rdist_histograms, _type='rw', boundary = False):
     sdist_hist = {}
+    name = subtracted_hist_name(_type)
 
     for PC, rdist in rdist_histograms['rw_rdist_hist'].iteritems():
-        sdist_hist[PC] = {}
         #the mapping from reuse distances to stack distances is always built
         #from the full reuse distance histogram.
-        rdist_sdist_map = lru_sdist(rdist, boundary)
-
-        for (rdist, count) in rdist.items():
-            sdist = int(round(rdist_sdist_map[rdist]))
-            sdist_hist[PC][sdist] = sdist_hist[PC].get(sdist, 0) + count
-
-            if _type == 'rw':
-                pass
-            elif _type == 'r':
-                # might be we don't need to subtract anything
-                if PC in rdist_histograms['wr_rdist_hist']:
-                    sdist_hist[PC][sdist] -= rdist_histograms['wr_rdist_hist'][PC].get(rdist, 0)
-            elif _type == 'w':
-                # might be we don't need to subtract anything
-                if PC in rdist_histograms['rd_rdist_hist']:
-                    sdist_hist[PC][sdist] -= rdist_histograms['rd_rdist_hist'][PC].get(rdist, 0)
-            else:
-                raise Exception("Unknown sample type")
+        subtract_hist = rdist_histograms[name].get(PC) if name != None else None
+        sdist_hist[PC] = map_sdist_hist(rdist, subtract_hist, boundary)
 
     return sdist_hist
 
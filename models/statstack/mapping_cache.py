@@ -0,0 +1,75 @@
+#  This file is part of the program: Processor Modeling Tool (PMT).
+#
+#  PMT is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  PMT is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with PMT.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  Authors: Sam Van den Steen, Ghent University
+#  Copyright: 2016, Ghent University
+
+import sys
+from collections import OrderedDict
+
+# approximate size of the int key and float value objects of a mapping entry
+ENTRY_OBJECTS_SIZE = 48
+
+# the cache shared by all Statstack objects of this process
+shared_cache = None
+
+def mapping_size(mapping):
+	if hasattr(mapping, "nbytes"):
+		return mapping.nbytes
+	return sys.getsizeof(mapping) + ENTRY_OBJECTS_SIZE * len(mapping)
+
+# Least recently used cache of rdist -> sdist mappings, bounded by an (approximate) number of bytes
+class Sdist_Mapping_Cache(object):
+	def __init__(self, budget):
+		self.budget = budget
+		self.mappings = OrderedDict()
+		self.size = 0
+		self.hits, self.misses, self.evictions = 0, 0, 0
+
+	# return the mapping of key, compute() is only called if it is not cached
+	def get(self, key, compute):
+		if key in self.mappings:
+			self.hits += 1
+			# move the mapping to the most recently used end
+			entry = self.mappings.pop(key)
+			self.mappings[key] = entry
+			return entry[0]
+
+		self.misses += 1
+		mapping = compute()
+		size = mapping_size(mapping)
+		if size <= self.budget:
+			self.mappings[key] = (mapping, size)
+			self.size += size
+			while self.size > self.budget:
+				evicted_key, (evicted_mapping, evicted_size) = self.mappings.popitem(last = False)
+				self.size -= evicted_size
+				self.evictions += 1
+
+		return mapping
+
+	# the cached mappings are kept
+	def reset_stats(self):
+		self.hits, self.misses, self.evictions = 0, 0, 0
+
+	def stats(self):
+		return "%d hits, %d misses, %d evictions, %d mappings cached (%.1f MB)" % (self.hits, self.misses, self.evictions, len(self.mappings), self.size / (1024.0 * 1024.0))
+
+# all Statstack objects of a process share one cache, it is replaced when another budget is requested
+def get_shared_cache(budget):
+	global shared_cache
+	if shared_cache is None or shared_cache.budget != budget:
+		shared_cache = Sdist_Mapping_Cache(budget)
+	return shared_cache
@@ -0,0 +1,107 @@
+#  This file is part of the program: Processor Modeling Tool (PMT).
+#
+#  PMT is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  PMT is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with PMT.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  Authors: Sam Van den Steen, Ghent University
+#  Copyright: 2016, Ghent University
+
+import os, pickle, numpy
+
+from sdist_curve import Sdist_Curve, sample_miss_ratios, PC_miss_ratios
+from statstack import interpolate_window_miss_ratios
+from window_interpolation import Window_Interpolation
+
+MISS_RATIO_CURVES_VERSION = 2
+
+# Miss ratio curves of every burst (loads, stores, instructions) and of every PC per window (trace), together with the
+# window bounds, burst indexes and sample rates needed to interpolate them, so miss counts of any cache size can be
+# queried without reading the profile again
+class Miss_Ratio_Curves(object):
+	def __init__(self, window_bounds):
+		self.version = MISS_RATIO_CURVES_VERSION
+		self.window_bounds = window_bounds
+		# name -> {"burst_index", "sample_rate", "aligned_bursts", "curves" : {burst: Sdist_Curve}}
+		self.sources = {}
+		# per window a {PC: Sdist_Curve} dict
+		self.trace_curves = []
+
+	def add_source(self, name, statstack, aligned_bursts):
+		self.sources[name] = {"burst_index" : statstack.burst_index, "sample_rate" : statstack.sample_rate, "aligned_bursts" : aligned_bursts, "curves" : {}}
+
+	def add_sd_hists(self, name, sdist_hists):
+		curves = self.sources[name]["curves"]
+		for burst, sdist_hist in sdist_hists.iteritems():
+			if burst not in curves:
+				curves[burst] = Sdist_Curve(sdist_hist)
+
+	def add_trace_sd_hists(self, sdist_hists_PC):
+		burst = sdist_hists_PC.keys()[0]
+		self.trace_curves.append(dict((pc, Sdist_Curve(hist)) for pc, hist in sdist_hists_PC[burst].iteritems()))
+
+	def save(self, filename):
+		tmp_filename = filename + "." + str(os.getpid()) + ".tmp"
+		f = open(tmp_filename, "wb")
+		pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+		f.close()
+		os.rename(tmp_filename, filename)
+
+	def windows(self):
+		return len(self.window_bounds)
+
+	# the curve (cache size in lines) of one burst as a missratio.MissRatio, None if the burst has no references
+	def miss_ratio_curve(self, name, burst):
+		return self.sources[name]["curves"][burst].miss_ratio_curve()
+
+	# (miss ratio, accesses) per cache size of a window, as Statstack.interpolate_miss_ratios returns them
+	def window_miss_ratios(self, name, window, cache_sizes, line_size):
+		source = self.sources[name]
+		bursts = source["aligned_bursts"][window]
+		miss_ratios = sample_miss_ratios([source["curves"][b] for b in bursts if b in source["curves"]], cache_sizes, line_size)
+		return interpolate_window_miss_ratios(source["burst_index"], source["sample_rate"], self.window_bounds[window], bursts, miss_ratios)
+
+	# interpolated number of misses per cache size of a window
+	def window_misses(self, name, window, cache_sizes, line_size):
+		return dict((cs, mr * accesses) for cs, (mr, accesses) in self.window_miss_ratios(name, window, cache_sizes, line_size).iteritems())
+
+	# interpolated misses (cache sizes x windows) and accesses (windows) of all windows at once
+	def all_window_misses(self, name, cache_sizes, line_size):
+		source = self.sources[name]
+		cache_sizes_in_lines = [c / line_size for c in sorted(cache_sizes)]
+		interpolation = Window_Interpolation(source["burst_index"], source["sample_rate"], self.window_bounds, source["aligned_bursts"])
+
+		ratios = numpy.zeros((len(cache_sizes_in_lines), ) + interpolation.weights.shape)
+		counts = numpy.zeros(interpolation.weights.shape)
+		burst_ratios = {}
+		for window, bursts in enumerate(source["aligned_bursts"]):
+			for slot, b in enumerate([b for b in bursts if b in source["curves"]]):
+				curve = source["curves"][b]
+				if curve.ref_count > 0:
+					if b not in burst_ratios:
+						burst_ratios[b] = curve.misses(cache_sizes_in_lines) / float(curve.ref_count)
+					ratios[:, window, slot] = burst_ratios[b]
+					counts[window, slot] = curve.ref_count
+
+		return interpolation.interpolate(range(self.windows()), ratios, counts)
+
+	# (miss ratio, loads) per cache size and PC of a window, as Statstack.calculate_PC_miss_ratios returns them
+	def trace_miss_ratios(self, window, cache_sizes, line_size):
+		return PC_miss_ratios(self.trace_curves[window], cache_sizes, line_size)
+
+def load_miss_ratio_curves(filename):
+	f = open(filename, "rb")
+	curves = pickle.load(f)
+	f.close()
+	if getattr(curves, "version", None) != MISS_RATIO_CURVES_VERSION:
+		raise ValueError("%s has an unsupported miss ratio curve format" % (filename))
+	return curves
@@ -0,0 +1,77 @@
+#  This file is part of the program: Processor Modeling Tool (PMT).
+#
+#  PMT is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  PMT is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with PMT.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  Authors: Sam Van den Steen, Ghent University
+#  Copyright: 2016, Ghent University
+
+import numpy
+import missratio
+from aif_lib import as_distance_hist
+
+# Cumulative form of an sdist histogram, the number of misses of any cache size is one searchsorted away
+class Sdist_Curve(object):
+	def __init__(self, sdist_hist):
+		sdists, counts = as_distance_hist(sdist_hist).all_arrays()
+		# float keys, so cache sizes of any size can be looked up
+		self.sdists = sdists.astype(numpy.float64)
+		# cum_counts[i] is the number of references with an sdist smaller than sdists[i]
+		self.cum_counts = numpy.append(0, numpy.cumsum(counts)).astype(numpy.int64)
+		self.ref_count = int(self.cum_counts[-1])
+
+	# number of references with an sdist of at least the cache size (in lines), for every cache size at once
+	def misses(self, cache_sizes_in_lines):
+		return self.ref_count - self.cum_counts[numpy.searchsorted(self.sdists, cache_sizes_in_lines, 'left')]
+
+	# same result as Statstack.compute_miss_ratio, for every cache size at once
+	def miss_ratios(self, cache_sizes_in_lines):
+		if self.ref_count == 0:
+			return [0.0] * len(cache_sizes_in_lines)
+		return (self.misses(cache_sizes_in_lines) / float(self.ref_count)).tolist()
+
+	# the full miss ratio curve (cache size in lines), it returns the same miss ratio as miss_ratios for every cache size
+	def miss_ratio_curve(self):
+		if self.ref_count == 0 or len(self.sdists) == 0:
+			return None
+		# a cache of sdist + 1 lines is the smallest one that hits the references with this sdist
+		ratios = (self.ref_count - self.cum_counts[:-1]) / float(self.ref_count)
+		return missratio.MissRatio(zip((self.sdists + 1).tolist(), ratios.tolist()))
+
+# miss ratios and reference counts of a list of curves (one per burst) for every cache size, as returned by Statstack.calculate_sample_miss_ratios
+def sample_miss_ratios(curves, cache_sizes, line_size):
+	miss_ratios = {}
+	cache_sizes = sorted(cache_sizes)
+	cache_sizes_in_lines = [c / line_size for c in cache_sizes]
+	for c in cache_sizes:
+		miss_ratios[c] = []
+
+	for curve in curves:
+		for c, mr in zip(cache_sizes, curve.miss_ratios(cache_sizes_in_lines)):
+			miss_ratios[c].append((mr, curve.ref_count))
+
+	return miss_ratios
+
+# miss ratios and reference counts of a {PC: curve} dict for every cache size, as returned by Statstack.calculate_PC_miss_ratios
+def PC_miss_ratios(curves_PC, cache_sizes, line_size):
+	miss_ratios_PC = {}
+	cache_sizes = sorted(cache_sizes)
+	cache_sizes_in_lines = [c / line_size for c in cache_sizes]
+	for c in cache_sizes:
+		miss_ratios_PC[c] = {}
+
+	for pc, curve in curves_PC.iteritems():
+		for c, mr in zip(cache_sizes, curve.miss_ratios(cache_sizes_in_lines)):
+			miss_ratios_PC[c][pc] = (mr, curve.ref_count)
+
+	return miss_ratios_PC
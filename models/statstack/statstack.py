@@ -19,13 +19,194 @@
 #			Moncef Mechri, Uppsala University
 #  Copyright: 2016, Ghent University
 
-import sys, os, bisect, pickle, pdb, time, glob
+import sys, os, bisect, pickle, pdb, time, glob, array, multiprocessing, tempfile, shutil, numpy
 from collections import Counter, defaultdict
 
-import lrumodel
-from aif_lib import sd_file_util, memory_file_pb2, Stream_Reader
+import lrumodel, mapping_cache, sdist_curve
+from burst_hists import Burst_Hists_Builder
+from burst_index import Burst_Index
+from landing_events import Landing_Events, Landing_Events_Error
+from sdist_curve import Sdist_Curve
+from window_interpolation import Window_Interpolation
+from aif_lib import sd_file_util, protobuf_util, memory_file_pb2, Stream_Reader, Column_Reader, Field_Filter, Distance_Hist
 from in_out import Debug_Printer
 
+# part of the stack distance cache keys, change this whenever the stack distances computed for the same input change
+SD_CACHE_VERSION = "1"
+
+# field paths of the access types of a memory_file_pb2.Sample, used to filter samples before decoding them
+TAKEOFF_ACCESS_TYPE = (1, 5)
+LANDING_ACCESS_TYPE = (2, 5)
+
+# number of samples that are grouped into histogram pairs at once
+RDIST_CHUNK_SIZE = 1024 * 1024
+
+# sdist of an rdist without a takeoff burst before any rdist of its burst was mapped, it is counted as the last sdist mapped for an earlier burst
+CARRIED_SDIST = -1
+
+# the processes that map the bursts of a window to stack distances in parallel, one pool is shared by all Statstack objects of a benchmark
+sdist_process_pool = None
+# the Statstack objects the sdist processes map bursts for, by their sdist key, the processes inherit them when they fork
+sdist_statstacks = {}
+
+# samples are read from their memory-mapped columns if a column directory is given (see aif_lib.sample_columns), otherwise from the protobuf files
+def open_sample_reader(file_list, compressed, read_ahead = 0, columns_dir = None, message_filter = None):
+	if columns_dir != None:
+		return Column_Reader(file_list, compressed, columns_dir, message_filter)
+	else:
+		return Stream_Reader(file_list, "STATSTACK", compressed, read_ahead = read_ahead, message_filter = message_filter)
+
+# gather the (burst, rdist) pairs of the samples in machine integer arrays, every chunk is grouped with numpy by the builder
+def count_rdists_new(samples, builder):
+	bursts, rdists = array.array('l'), array.array('l')
+	append_burst, append_rdist = bursts.append, rdists.append
+	for sample in samples:
+		# every access of a submessage creates a new wrapper object, so begin is looked up once
+		begin = sample.begin
+		# should this be begin or end?
+		append_burst(begin.burst_id)
+		if sample.HasField('end'):
+			append_rdist(sample.end.access_counter - begin.access_counter - 1)
+		else:
+			append_rdist(sys.maxint)
+
+		if len(bursts) == RDIST_CHUNK_SIZE:
+			builder.add_pairs(numpy.frombuffer(bursts, dtype = numpy.int_), numpy.frombuffer(rdists, dtype = numpy.int_))
+			bursts, rdists = array.array('l'), array.array('l')
+			append_burst, append_rdist = bursts.append, rdists.append
+
+	builder.add_pairs(numpy.frombuffer(bursts, dtype = numpy.int_), numpy.frombuffer(rdists, dtype = numpy.int_))
+
+def count_rdists_old(samples, rdist_hists, rdist_hists_load, rdist_hists_store):
+	for sample in samples:
+		if sample.HasField('end'):
+			rdist = sample.end.access_counter - sample.begin.access_counter - 1
+			rdist_hists[sample.begin.burst_id][rdist] += 1
+			if sample.end.access_type == 0:
+				rdist_hists_load[sample.begin.burst_id][rdist] += 1
+			elif sample.end.access_type == 1:
+				rdist_hists_store[sample.begin.burst_id][rdist] += 1
+		else:
+			rdist_hists[sample.begin.burst_id][sys.maxint] += 1
+			if sample.begin.access_type == 0:
+				rdist_hists_load[sample.begin.burst_id][sys.maxint] += 1
+			elif sample.begin.access_type == 1:
+				rdist_hists_store[sample.begin.burst_id][sys.maxint] += 1
+
+def count_rdists_old_PC(samples, rdist_hists, rdist_hists_load, rdist_hists_store):
+	for sample in samples:
+		pc = sample.begin.program_counter
+
+		if not sample.begin.burst_id in rdist_hists:
+			rdist_hists[sample.begin.burst_id] = defaultdict(Counter)
+			rdist_hists_load[sample.begin.burst_id] = defaultdict(Counter)
+			rdist_hists_store[sample.begin.burst_id] = defaultdict(Counter)
+
+		if sample.HasField('end'):
+			rdist = sample.end.access_counter - sample.begin.access_counter - 1
+			rdist_hists[sample.begin.burst_id][pc][rdist] += 1
+			if sample.end.access_type == 0:
+				rdist_hists_load[sample.begin.burst_id][pc][rdist] += 1
+			elif sample.end.access_type == 1:
+				rdist_hists_store[sample.begin.burst_id][pc][rdist] += 1
+		else:
+			rdist_hists[sample.begin.burst_id][pc][sys.maxint] += 1
+			if sample.begin.access_type == 0:
+				rdist_hists_load[sample.begin.burst_id][pc][sys.maxint] += 1
+			elif sample.begin.access_type == 1:
+				rdist_hists_store[sample.begin.burst_id][pc][sys.maxint] += 1
+
+# Same as count_rdists_new, but the pairs are taken from the sample columns without creating python objects
+def count_rdists_new_columns(columns, builder):
+	for first in range(0, len(columns), RDIST_CHUNK_SIZE):
+		last = first + RDIST_CHUNK_SIZE
+		bursts = columns["begin_burst_id"][first:last]
+		rdists = numpy.where(columns["has_end"][first:last], columns["end_access_counter"][first:last] - columns["begin_access_counter"][first:last] - 1, sys.maxint)
+		builder.add_pairs(bursts, rdists)
+
+# Worker of the parallel histogram construction: count the reuse distances of a single sample file
+def rdist_hists_from_file(args):
+	sample_file, compressed, version, columns_dir = args
+	sample_reader = open_sample_reader([sample_file], compressed, columns_dir = columns_dir)
+	samples = sample_reader.iter_in_place()
+
+	if version == "new":
+		builder = Burst_Hists_Builder()
+		if columns_dir != None:
+			for columns in sample_reader.iter_columns():
+				count_rdists_new_columns(columns, builder)
+		else:
+			count_rdists_new(samples, builder)
+		return builder.build()
+	elif version == "old":
+		rdist_hists, rdist_hists_load, rdist_hists_store = defaultdict(Counter), defaultdict(Counter), defaultdict(Counter)
+		count_rdists_old(samples, rdist_hists, rdist_hists_load, rdist_hists_store)
+	elif version == "old_PC":
+		rdist_hists, rdist_hists_load, rdist_hists_store = {}, {}, {}
+		count_rdists_old_PC(samples, rdist_hists, rdist_hists_load, rdist_hists_store)
+
+	return rdist_hists, rdist_hists_load, rdist_hists_store
+
+# every sdist process caches its own mappings, so all of them together stay within the mapping cache budget
+def init_sdist_worker(mapping_cache_budget):
+	cache = mapping_cache.get_shared_cache(mapping_cache_budget)
+	for statstack in sdist_statstacks.values():
+		statstack.mapping_cache = cache
+
+# Worker of the parallel stack distance calculation: map the rdists of a single burst
+def burst_sdists_worker(args):
+	key, burst, rdists = args
+	return sdist_statstacks[key].burst_sdists(burst, rdists)
+
+# Fork the sdist processes for the Statstack objects of a benchmark that map bursts, call this after all of them were created
+# (so the processes inherit their reuse distance histograms) and before any stream is read ahead (threads do not survive a fork)
+def start_sdist_pool(constants, statstacks):
+	global sdist_process_pool, sdist_statstacks
+	stop_sdist_pool()
+	statstacks = [statstack for statstack in statstacks if statstack.can_map_in_parallel()]
+	if constants.statstack_processes <= 1 or len(statstacks) == 0 or multiprocessing.current_process().daemon:
+		return
+
+	sdist_statstacks = dict(enumerate(statstacks))
+	for key, statstack in sdist_statstacks.items():
+		statstack.sdist_key = key
+	sdist_process_pool = multiprocessing.Pool(constants.statstack_processes, init_sdist_worker, (constants.mapping_cache_size * 1024 * 1024 / constants.statstack_processes, ))
+
+def stop_sdist_pool():
+	global sdist_process_pool, sdist_statstacks
+	if sdist_process_pool != None:
+		sdist_process_pool.close()
+		sdist_process_pool.join()
+	sdist_process_pool = None
+	sdist_statstacks = {}
+
+# Close the Statstack objects of a benchmark once all windows were processed and stop their sdist pool
+# they share the mapping cache of this process, so its stats are logged once for the benchmark and counted from zero for the next one
+def close_statstacks(statstacks):
+	for statstack in statstacks:
+		statstack.close()
+	stop_sdist_pool()
+
+	mapping = [statstack for statstack in statstacks if statstack.maps_sdists()]
+	if len(mapping) > 0:
+		mapping[0].debug_printer.save_log_stats("Stack distance mapping cache: " + mapping[0].mapping_cache.stats())
+		mapping[0].mapping_cache.reset_stats()
+
+# Add the per burst histograms of partial_hists to rdist_hists, counts are integers so the result does not depend on the merge order
+def merge_hists(rdist_hists, partial_hists):
+	for burst, hist in partial_hists.iteritems():
+		rdist_hists[burst].update(hist)
+
+def merge_PC_hists(rdist_hists, partial_hists):
+	for burst, PC_hists in partial_hists.iteritems():
+		if not burst in rdist_hists:
+			rdist_hists[burst] = defaultdict(Counter)
+		merge_hists(rdist_hists[burst], PC_hists)
+
+# interpolate the per burst miss ratios of every cache size over the window, this only needs the burst index and sample rate so stored miss ratio curves use it too
+def interpolate_window_miss_ratios(burst_index, sample_rate, current_window, current_bursts, miss_ratios):
+	return Window_Interpolation(burst_index, sample_rate, [current_window], [current_bursts]).miss_ratios(0, miss_ratios)
+
 class Statstack:
 	def __init__(self, constants, benchmark, base_name, ss_version, _type, content, profiler_metadata, progress_printer):
 		self.input_dir = constants.input_dir
@@ -42,40 +223,63 @@ class Statstack:
 		self.content = content
 
 		self.compressed = bool(int(profiler_metadata["enable_compression"]))
+		self.read_ahead = constants.read_ahead
+		self.statstack_processes = constants.statstack_processes
+		# key of this Statstack in the sdist pool of its benchmark, see start_sdist_pool
+		self.sdist_key = None
+		self.compress_sd_hists = constants.compress_sd_hists
+		# rdist -> sdist mappings are cached per vicinity, the cache is shared by all Statstack objects (and thus windows) of this process
+		self.mapping_cache = mapping_cache.get_shared_cache(constants.mapping_cache_size * 1024 * 1024)
+		# memory cap of the reuse distance histograms, 0 keeps the histograms of all bursts in memory for the whole run
+		self.statstack_memory = constants.statstack_memory * 1024 * 1024
+		self.spill_rdist_hists = constants.spill_rdist_hists
+		self.rdist_spill_dir = None
+		# number of most significant bits kept of every stack distance, None keeps them exact
+		self.sd_hist_precision = constants.sd_hist_precision if constants.sd_hist_precision > 0 else None
+		# stack distance histograms and sample columns are cached here, the input directory is only read
+		self.cache_root = constants.cache_dir if constants.cache_dir != None else self.input_dir
+		# decode the protobuf sample files once into memory-mapped columns and read those instead
+		self.columns_dir = None
+		if constants.sample_columns:
+			self.columns_dir = os.path.join(self.cache_root, "sample_columns", self.benchmark)
+		# every sample reader that was opened, the landing events stop reading them before the end of the files
+		self.sample_readers = []
 		self.sample_rate = int(profiler_metadata["p"])
 
 		self.progress_printer = progress_printer
 		self.debug_printer = Debug_Printer(self.output_dir, benchmark, "debug_statstack")
 
-		self.prev_bursts = []
+		# per access type ('r' or 'w')
+		self.prev_bursts = {}
 		self.prev_sd_hists = {}
 
-		# generate sd file names
+		# generate sd file names, the key changes whenever the input or the statstack configuration changes, so stale histograms are never reused
+		self.discover_sample_files()
+		self.sd_hists_dir = os.path.join(self.cache_root, "sd_hists_" + self.ss_version, self.benchmark)
+		key = self.sd_cache_key()
 		self.load_sd_file, self.store_sd_file = None, None
 		if self.type == "sample":
 			if self.content == "data":
-				self.load_sd_file = os.path.join(self.input_dir, "sd_hists_" + self.ss_version, "sd_load_" + self.benchmark + ".in")
-				self.store_sd_file = os.path.join(self.input_dir, "sd_hists_" + self.ss_version, "sd_store_" + self.benchmark + ".in")
+				self.load_sd_file = os.path.join(self.sd_hists_dir, "sd_load_" + key + ".in")
+				self.store_sd_file = os.path.join(self.sd_hists_dir, "sd_store_" + key + ".in")
 			elif self.content == "instr":
-				self.load_sd_file = os.path.join(self.input_dir, "sd_hists_" + self.ss_version, "sd_instr_" + self.benchmark + ".in")
+				self.load_sd_file = os.path.join(self.sd_hists_dir, "sd_instr_" + key + ".in")
 		elif self.type == "trace":
-			self.load_sd_file = os.path.join(self.input_dir, "sd_hists_" + self.ss_version, "sd_load_PC_" + self.benchmark + ".in")
+			self.load_sd_file = os.path.join(self.sd_hists_dir, "sd_load_PC_" + key + ".in")
 
-		# check if these files exist already, if they do, we don't need to calculate stack distances again
-		self.load_sd_gen, self.store_sd_gen = None, None
-		if os.path.isfile(self.load_sd_file):
+		# check if these files were completed by an earlier run, if they were, we don't need to calculate stack distances again
+		self.load_sd_reader, self.store_sd_reader = None, None
+		self.load_sd_writer, self.store_sd_writer = None, None
+		if sd_file_util.is_complete(self.load_sd_file):
 			if self.type == "sample":
-				load_reader = sd_file_util.SD_Hist_Reader(self.load_sd_file, PC = False)
+				self.load_sd_reader = sd_file_util.SD_Hist_Reader(self.load_sd_file, PC = False)
 			elif self.type == "trace":
-				load_reader = sd_file_util.SD_Hist_Reader(self.load_sd_file, PC = True)
-			self.load_sd_gen = load_reader.iter_in_place()
-		if self.store_sd_file != None and os.path.isfile(self.store_sd_file):
-			store_reader = sd_file_util.SD_Hist_Reader(self.store_sd_file, PC = False)
-			self.store_sd_gen = store_reader.iter_in_place()
-
-		# if one or more generators don't exist, we have to read the files
-		if (self.type != "trace" and self.content != "instr" and self.store_sd_gen == None) or self.load_sd_gen == None:
-			no_ooo_sample_files = self.discover_sample_files()
+				self.load_sd_reader = sd_file_util.SD_Hist_Reader(self.load_sd_file, PC = True)
+		if self.store_sd_file != None and sd_file_util.is_complete(self.store_sd_file):
+			self.store_sd_reader = sd_file_util.SD_Hist_Reader(self.store_sd_file, PC = False)
+
+		# if one or more sd hist files don't exist, we have to read the sample files
+		if (self.type != "trace" and self.content != "instr" and self.store_sd_reader == None) or self.load_sd_reader == None:
 			self.progress_printer.print_message("Creating reuse distance histograms from files " + ", ".join(sorted([s.split("/")[-1] for s in self.all_samples])))
 			if self.ss_version == "old":
 				self.create_rdist_hists_old()
@@ -84,10 +288,15 @@ class Statstack:
 			elif self.ss_version == "new":
 				self.create_rdist_hists_new()
 
-				self.create_generators()
-
-				self.last_dangling = None
-				self.last_ooo = [None] * no_ooo_sample_files
+				# the samples of every access type without a cached sd hist file are categorized in the same pass, data samples give loads and stores at once
+				self.landing_types = []
+				if self.load_sd_reader == None:
+					self.landing_types.append('r')
+				if self.store_sd_file != None and self.store_sd_reader == None:
+					self.landing_types.append('w')
+				self.landing_events = None
+				# landing histograms of the other access type, kept until that type asks for the same bursts
+				self.pending_landing_hists = {}
 
 			self.create_sd_hist_writers()
 
@@ -95,120 +304,89 @@ class Statstack:
 		self.read_burst_edges(os.path.join(self.benchmark_root, "burst_" + self.file_base_name + ".0"))
 
 	def get_sd_hists(self, _type="rw", bursts = []):
-		unique_bursts = sorted(list(set(bursts) - set(self.prev_bursts)))
-		if _type == "r":
-			if self.load_sd_gen != None:
-				# fetch the stack distance histogram
-				self.sdist_hists = {}
-				for ub in unique_bursts:
-					sd_hist_pb = next(self.load_sd_gen)
-					if self.type == "sample":
-						self.sdist_hists[ub] = Counter()
-						for sd,count in zip(sd_hist_pb.sd, sd_hist_pb.count):
-							self.sdist_hists[ub][int(sd)] = int(count)
-					elif self.type == "trace":
-						self.sdist_hists_PC = defaultdict(Counter)
-						burst = sd_hist_pb.burst_id
-						self.sdist_hists_PC[burst] = defaultdict(Counter)
-						for sd_hist in sd_hist_pb.sd_hists:
-							PC = sd_hist.id
-							self.sdist_hists_PC[burst][PC] = defaultdict(Counter)
-							for sd,count in zip(sd_hist.sd, sd_hist.count):
-								self.sdist_hists_PC[burst][PC][sd] = count
-
-				intersection = list(set(self.prev_bursts) & set(bursts))
-				for intersect in intersection:
-					if self.type == "sample":
-						self.sdist_hists[intersect] = self.prev_sd_hists[intersect]
-					elif self.type == "trace":
-						self.sdist_hists_PC[intersect] = self.prev_sd_hists[intersect]
-			else:
-				# calculate the stack distance histogram
-				if self.ss_version == "old":
-					# we're not using generators here anymore, all data is kept in memory, so no need to use unique bursts
-					self.calculate_sdist_hists_old(bursts)
-				elif self.ss_version == "new":
-					# because we're using a generator here, we need to use unique bursts, because the stack distances for previously encountered bursts have already been calculated and we cannot calculate them again without rebuilding and reiterating the generator
-					self.sdist_hists = defaultdict(Counter)
-					if self.type == "trace":
-						self.sdist_hists_PC = defaultdict()
-					if len(unique_bursts) > 0:
-						self.calculate_sdist_hists_new(unique_bursts, _type='r')
-					if self.type == "sample":
-						self.save_sd_hist(self.sdist_hists, "load")
-						intersection = list(set(self.prev_bursts) & set(bursts))
-						for intersect in intersection:
-							self.sdist_hists[intersect] = self.prev_sd_hists[intersect]
-					elif self.type == "trace":
-						self.save_sd_hist(self.sdist_hists_PC, "load")
-						intersection = list(set(self.prev_bursts) & set(bursts))
-						for intersect in intersection:
-							self.sdist_hists_PC[intersect] = self.prev_sd_hists[intersect]
-		elif _type == "w":
-			if self.store_sd_gen != None:
-				# fetch the stack distance histogram
-				self.sdist_hists = {}
-				for ub in unique_bursts:
-					if self.type == "sample":
-						sd_hist_pb = next(self.store_sd_gen)
-						self.sdist_hists[ub] = Counter()
-						for sd,count in zip(sd_hist_pb.sd, sd_hist_pb.count):
-							self.sdist_hists[ub][int(sd)] = int(count)
-					elif self.type == "trace":
-						self.sdist_hists_PC = defaultdict(Counter)
-						burst = sd_hist_pb.burst_id
-						self.sdist_hists_PC[burst] = defaultdict(Counter)
-						for sd_hist in sd_hist_pb.sd_hists:
-							PC = sd_hist.id
-							self.sdist_hists_PC[burst][PC] = defaultdict(Counter)
-							for sd,count in zip(sd_hist.sd, sd_hist.count):
-								self.sdist_hists_PC[burst][PC][sd] = count
-
-				intersection = list(set(self.prev_bursts) & set(bursts))
-				for intersect in intersection:
-					if self.type == "sample":
-						self.sdist_hists[intersect] = self.prev_sd_hists[intersect]
-					elif self.type == "trace":
-						self.sdist_hists_PC[intersect] = self.prev_sd_hists[intersect]
-			else:
-				# calculate the stack distance histogram
-				if self.ss_version == "old":
-					self.calculate_sdist_hists_old(bursts)
-				elif self.ss_version == "new":
-					self.sdist_hists = defaultdict(Counter)
-					if self.type == "trace":
-						self.sdist_hists_PC = defaultdict()
-					if len(unique_bursts) > 0:
-						self.calculate_sdist_hists_new(unique_bursts, _type='w')
-					if self.type == "sample":
-						self.save_sd_hist(self.sdist_hists, "store")
-						intersection = list(set(self.prev_bursts) & set(bursts))
-						for intersect in intersection:
-							self.sdist_hists[intersect] = self.prev_sd_hists[intersect]
-					elif self.type == "trace":
-						self.save_sd_hist(self.sdist_hists_PC, "store")
-						intersection = list(set(self.prev_bursts) & set(bursts))
-						for intersect in intersection:
-							self.sdist_hists_PC[intersect] = self.prev_sd_hists[intersect]
-
-		self.prev_bursts = bursts
-		if self.type == "sample":
-			self.prev_sd_hists = self.sdist_hists
-			return self.sdist_hists
-		elif self.type == "trace":
-			self.prev_sd_hists = self.sdist_hists_PC
-			return self.sdist_hists_PC
+		if _type != 'r' and _type != 'w':
+			raise ValueError('Unknown access_type %s' % (_type))
 
-	def create_sd_hist_writers(self):
-		sd_hists_dir_name = "sd_hists_" + self.ss_version
+		# a data Statstack serves both loads and stores, every access type keeps its own previous window
+		prev_bursts = self.prev_bursts.get(_type, [])
+		unique_bursts = sorted(list(set(bursts) - set(prev_bursts)))
+		reader = self.load_sd_reader if _type == "r" else self.store_sd_reader
+		data = "load" if _type == "r" else "store"
+
+		reuse_prev = True
+		if reader != None:
+			# fetch the stack distance histogram
+			self.read_sd_hists(reader, unique_bursts)
+		else:
+			# calculate the stack distance histogram
+			if self.ss_version == "old":
+				# we're not using generators here anymore, all data is kept in memory, so no need to use unique bursts
+				self.calculate_sdist_hists_old(bursts)
+				reuse_prev = False
+			elif self.ss_version == "new":
+				# because we're using a generator here, we need to use unique bursts, because the stack distances for previously encountered bursts have already been calculated and we cannot calculate them again without rebuilding and reiterating the generator
+				self.sdist_hists = defaultdict(Distance_Hist)
+				if self.type == "trace":
+					self.sdist_hists_PC = defaultdict()
+				if len(unique_bursts) > 0:
+					self.calculate_sdist_hists_new(unique_bursts, _type=_type)
+				if self.type == "sample":
+					self.save_sd_hist(self.sdist_hists, data)
+				elif self.type == "trace":
+					self.save_sd_hist(self.sdist_hists_PC, data)
+
+		sd_hists = self.sdist_hists if self.type == "sample" else self.sdist_hists_PC
+		# bursts shared with the previous window were already fetched or calculated
+		if reuse_prev:
+			intersection = list(set(prev_bursts) & set(bursts))
+			for intersect in intersection:
+				sd_hists[intersect] = self.prev_sd_hists[_type][intersect]
+
+		self.prev_bursts[_type] = bursts
+		self.prev_sd_hists[_type] = sd_hists
+		return sd_hists
+
+	# bursts are looked up in the index of the sd hist file, so windows don't have to be fetched in order
+	def read_sd_hists(self, reader, unique_bursts):
+		self.sdist_hists = {}
+		if self.type == "trace":
+			self.sdist_hists_PC = {}
+		for ub, decoded in reader.read_bursts(unique_bursts):
+			if self.type == "sample":
+				self.sdist_hists[ub] = decoded
+			elif self.type == "trace":
+				self.sdist_hists_PC[ub] = decoded
+
+	# every sd hist file of this Statstack was completed by an earlier run, none of its windows need to be calculated
+	def sd_hists_cached(self):
+		return self.load_sd_reader != None and (self.store_sd_file == None or self.store_sd_reader != None)
+
+	def sd_cache_key(self):
+		digest_dir = os.path.join(self.cache_root, "digests", self.benchmark)
+		input_files = sorted(self.all_samples) + [os.path.join(self.benchmark_root, "burst_" + self.file_base_name + ".0")]
+		digests = [(os.path.basename(f), sd_file_util.file_digest(f, digest_dir)) for f in input_files]
+		key = [SD_CACHE_VERSION, sd_file_util.SD_HIST_FORMAT, self.ss_version, self.type, self.content, self.sample_rate, digests]
+		# dropped reuse distance histograms can leave rdists without a vicinity, so those stack distances are not shared with complete runs
+		# the histograms are dropped in blocks that are sized after the memory cap
+		if self.statstack_memory > 0 and not self.spill_rdist_hists:
+			key.append(("dropped_rdist_hists", self.statstack_memory))
+		# bucketed stack distances are not the exact ones
+		if self.sd_hist_precision != None:
+			key.append(("sd_hist_precision", self.sd_hist_precision))
+		return sd_file_util.cache_key(key)
 
-		if not os.path.exists(os.path.join(self.input_dir, sd_hists_dir_name)):
-			os.makedirs(os.path.join(self.input_dir, sd_hists_dir_name))
+	def create_sd_hist_writers(self):
+		if not os.path.exists(self.sd_hists_dir):
+			try:
+				os.makedirs(self.sd_hists_dir)
+			except OSError:
+				# created by a concurrent run
+				pass
 
 		if self.load_sd_file != None:
-			self.load_sd_writer = sd_file_util.SD_Hist_Writer(self.load_sd_file)
+			self.load_sd_writer = sd_file_util.SD_Hist_Writer(self.load_sd_file, compression = self.compress_sd_hists)
 		if self.store_sd_file != None:
-			self.store_sd_writer = sd_file_util.SD_Hist_Writer(self.store_sd_file)
+			self.store_sd_writer = sd_file_util.SD_Hist_Writer(self.store_sd_file, compression = self.compress_sd_hists)
 
 	def save_sd_hist(self, sd_to_save, data):
 		if data == "load":
@@ -221,7 +399,34 @@ class Statstack:
 		if self.type == "trace":
 			message = writer.PC_dict_to_proto(sd_to_save)
 		for burst, proto in message:
-			writer.write_sd_hist(proto)
+			writer.write_sd_hist(proto, burst)
+
+	# the new statstack maps the rdists of every sd hist file it writes
+	def maps_sdists(self):
+		return self.ss_version == "new" and (self.load_sd_writer != None or self.store_sd_writer != None)
+
+	# finish the sd hist files, only call this after all windows were processed, otherwise the files are incomplete
+	def close(self):
+		for writer in [self.load_sd_writer, self.store_sd_writer]:
+			if writer != None:
+				writer.close()
+		for sample_reader in self.sample_readers:
+			sample_reader.close()
+		self.sample_readers = []
+
+		if self.maps_sdists() and self.statstack_memory > 0:
+			self.debug_printer.save_log_stats("Reuse distance histograms: " + self.rdist_hists.stats())
+		if self.rdist_spill_dir != None:
+			shutil.rmtree(self.rdist_spill_dir, ignore_errors = True)
+			self.rdist_spill_dir = None
+			# the spill directories of the benchmark and of all benchmarks are removed once the last spilling statstack closed
+			spill_root = os.path.join(self.cache_root, "rdist_spill", self.benchmark)
+			for spill_dir in [spill_root, os.path.dirname(spill_root)]:
+				try:
+					os.rmdir(spill_dir)
+				except OSError:
+					# still used by another statstack or run
+					break
 
 	def read_burst_edges(self, file_name):
 		self.burst_edges, self.burst_begin_edges = [], []
@@ -236,198 +441,20 @@ class Statstack:
 
 			self.burst_begin_edges.append(int(burst.memaccess_begin))
 
-	def align_bursts_windows(self, window_bounds):
-		aligned_bursts, iterate_burst_bounds = [], self.burst_edges
-
-		for wb in window_bounds:
-			burst_low = iterate_burst_bounds[0]
-			for ss_wb in iterate_burst_bounds:
-				if ss_wb[0] <= wb[0]:
-					burst_low = ss_wb
-				else:
-					break
-			burst_low_index = self.burst_edges.index(burst_low)
-			iterate_burst_bounds = self.burst_edges[burst_low_index:]
-
-			burst_high = iterate_burst_bounds[0]
-			for ss_wb in iterate_burst_bounds:
-				if ss_wb[1] > wb[1]:
-					burst_high = ss_wb
-					break
-			burst_high_index = self.burst_edges.index(burst_high)
-
-			aligned_bursts.append([])
-			for b in range(burst_low_index, burst_high_index + 1):
-				aligned_bursts[-1].append(b)
+		self.burst_index = Burst_Index(self.burst_edges)
 
-		return aligned_bursts
+	def align_bursts_windows(self, window_bounds):
+		return self.burst_index.align(window_bounds)
 
 	def interpolate_miss_ratios(self, current_window, current_bursts, miss_ratios):
-		interpolated_miss_ratios = {}
-
-		current_burst_edges = [[self.burst_edges[cb][0], self.burst_edges[cb][1]] for cb in current_bursts]
-
-		for cs,mr in miss_ratios.iteritems():
-			if len(current_burst_edges) > 1:
-				sample_low, sample_high = current_window[0], current_window[1]
-				curr_burst, all_misses, all_accesses = 0, 0, 0
-				ratio1, mpi1, misses1, api1, accesses1 = 0, 0, 0, 0, 0
-				mpi2, misses2, api2, accesses2 = 0, 0, 0, 0
-
-				while sample_low != sample_high:
-					if curr_burst + 1 < len(current_burst_edges):
-						ratio1 = max(current_burst_edges[curr_burst][1] - sample_low, 0.0)
-						try:
-							instr_curr_burst = current_burst_edges[curr_burst][1] - current_burst_edges[curr_burst][0]
-							mpi1 = float(mr[curr_burst][0] * mr[curr_burst][1] * self.sample_rate) / instr_curr_burst
-							api1 = float(mr[curr_burst][1] * self.sample_rate) / instr_curr_burst
-						except IndexError:
-							mpi1 = 0
-							api1 = 0
-						misses1 = mpi1 * ratio1
-						accesses1 = api1 * ratio1
-
-						# integration of linear interpolated function between mpi1 and mpi2
-						# no interpolation needed if difference is 0, bursts are next to each other
-						# CHECK THIS: this does not happen in our current setup, so we cannot test if it's correct
-						x1 = max(current_burst_edges[curr_burst][1], sample_low)
-						x2 = min(current_burst_edges[curr_burst + 1][0], current_window[1])
-						if current_burst_edges[curr_burst + 1][0] - current_burst_edges[curr_burst][1] != 0:
-							try:
-								instr_next_burst = current_burst_edges[curr_burst + 1][1] - current_burst_edges[curr_burst + 1][0]
-								mpi2 = float(mr[curr_burst][0] * mr[curr_burst][1] * self.sample_rate) / instr_next_burst
-								api2 = float(mr[curr_burst][1] * self.sample_rate) / instr_next_burst
-							except IndexError:
-								mpi2 = 0
-								api2 = 0
-
-							instr_burst = current_burst_edges[curr_burst + 1][0] - current_burst_edges[curr_burst][1]
-							misses2 = float(mpi1) * (x2 - x1) + float(mpi2 - mpi1) / instr_burst * (float(x2 ** 2) / 2 - float(x1 ** 2) / 2) + (current_burst_edges[curr_burst][1] * mpi1 - current_burst_edges[curr_burst][1] * mpi2) / instr_burst * (x2 - x1)
-							accesses2 = float(api1) * (x2 - x1) + float(api2 - api1) / instr_burst * (float(x2 ** 2) / 2 - float(x1 ** 2) / 2) + (current_burst_edges[curr_burst][1] * api1 - current_burst_edges[curr_burst][1] * api2) / instr_burst * (x2 - x1)
-
-						sample_low += ratio1 + (x2 - x1)
-						all_misses += misses1 + misses2
-						all_accesses += accesses1 + accesses2
-					else:
-						ratio1 = sample_high - current_burst_edges[curr_burst][0]
-						try:
-							instr_burst = current_burst_edges[curr_burst][1] - current_burst_edges[curr_burst][0]
-							mpi1 = float(mr[curr_burst][0] * mr[curr_burst][1] * self.sample_rate) / instr_burst
-							api1 = float(mr[curr_burst][1] * self.sample_rate) / instr_burst
-						except IndexError:
-							mpi1 = 0
-							api1 = 0
-						misses1 = mpi1 * ratio1
-						accesses1 = api1 * ratio1
-
-						sample_low += ratio1
-						all_misses += misses1
-						all_accesses += accesses1
-
-					curr_burst += 1
-
-				if all_accesses == 0:
-					interpolated_miss_ratios[cs] = (0, 0)
-				else:
-					interpolated_miss_ratios[cs] = (all_misses / all_accesses, all_accesses)
-			else:
-				try:
-					instr_burst = (current_burst_edges[0][1] - current_burst_edges[0][0])
-					mpi = float(mr[0][0] * mr[0][1] * self.sample_rate) / instr_burst
-					api = float(mr[0][1] * self.sample_rate) / instr_burst
-				except IndexError:
-					mpi = 0
-					api = 0
-
-				if api == 0:
-					interpolated_miss_ratios[cs] = (0, 0)
-				else:
-					interpolated_miss_ratios[cs]= (mpi / api, api * (current_window[1] - current_window[0]))
-
-		return interpolated_miss_ratios
+		return interpolate_window_miss_ratios(self.burst_index, self.sample_rate, current_window, current_bursts, miss_ratios)
 
 	def interpolate_L1_hits(self, current_window, current_bursts, L1_miss_ratio):
-		interpolated_miss_ratios = {}
-
-		current_burst_edges = [[self.burst_edges[cb][0], self.burst_edges[cb][1]] for cb in current_bursts]
-
-		if len(current_burst_edges) > 1:
-			sample_low, sample_high = current_window[0], current_window[1]
-			curr_burst, all_hits, all_accesses = 0, 0, 0
-			ratio1, hpi1, hits1, api1, accesses1 = 0, 0, 0, 0, 0
-			hpi2, hits2, api2, accesses2 = 0, 0, 0, 0
-
-			while sample_low != sample_high:
-				if curr_burst + 1 < len(current_burst_edges):
-					ratio1 = max(current_burst_edges[curr_burst][1] - sample_low, 0.0)
-					try:
-						instr_curr_burst = current_burst_edges[curr_burst][1] - current_burst_edges[curr_burst][0]
-						hpi1 = float((1 - L1_miss_ratio[curr_burst][0]) * L1_miss_ratio[curr_burst][1] * self.sample_rate) / instr_curr_burst
-						api1 = float(L1_miss_ratio[curr_burst][1] * self.sample_rate) / instr_curr_burst
-					except IndexError:
-						hpi1 = 0
-						api1 = 0
-					hits1 = hpi1 * ratio1
-					accesses1 = api1 * ratio1
-
-					# integration of linear interpolated function between hpi1 and hpi2
-					# no interpolation needed if difference is 0, bursts are next to each other
-					# CHECK THIS: this does not happen in our current setup, so we cannot test if it's correct
-					x1 = max(current_burst_edges[curr_burst][1], sample_low)
-					x2 = min(current_burst_edges[curr_burst + 1][0], current_window[1])
-					if current_burst_edges[curr_burst + 1][0] - current_burst_edges[curr_burst][1] != 0:
-						try:
-							instr_next_burst = current_burst_edges[curr_burst + 1][1] - current_burst_edges[curr_burst + 1][0]
-							hpi2 = float((1 - L1_miss_ratio[curr_burst][0]) * L1_miss_ratio[curr_burst][1] * self.sample_rate) / instr_next_burst
-							api2 = float(L1_miss_ratio[curr_burst][1] * self.sample_rate) / instr_next_burst
-						except IndexError:
-							mpi2 = 0
-							api2 = 0
-
-						instr_burst = current_burst_edges[curr_burst + 1][0] - current_burst_edges[curr_burst][1]
-						misses2 = float(hpi1) * (x2 - x1) + float(hpi2 - hpi1) / instr_burst * (float(x2 ** 2) / 2 - float(x1 ** 2) / 2) + (current_burst_edges[curr_burst][1] * hpi1 - current_burst_edges[curr_burst][1] * hpi2) / instr_burst * (x2 - x1)
-						accesses2 = float(api1) * (x2 - x1) + float(api2 - api1) / instr_burst * (float(x2 ** 2) / 2 - float(x1 ** 2) / 2) + (current_burst_edges[curr_burst][1] * api1 - current_burst_edges[curr_burst][1] * api2) / instr_burst * (x2 - x1)
-
-					sample_low += ratio1 + (x2 - x1)
-					all_hits += hits1 + hits2
-					all_accesses += accesses1 + accesses2
-				else:
-					ratio1 = sample_high - current_burst_edges[curr_burst][0]
-					try:
-						instr_burst = (current_burst_edges[curr_burst][1] - current_burst_edges[curr_burst][0])
-						hpi1 = float((1 - L1_miss_ratio[curr_burst][0]) * L1_miss_ratio[curr_burst][1] * self.sample_rate) / instr_burst
-						api1 = float(L1_miss_ratio[curr_burst][1] * self.sample_rate) / instr_burst
-					except IndexError:
-						hpi1 = 0
-						api1 = 0
-					hits1 = hpi1 * ratio1
-					accesses1 = api1 * ratio1
-
-					sample_low += ratio1
-					all_hits += hits1
-					all_accesses += accesses1
-
-				curr_burst += 1
-
-			if all_accesses == 0:
-				interpolated_L1_hits = 0
-			else:
-				interpolated_L1_hits = all_hits
-		else:
-			try:
-				instr_burst = (current_burst_edges[0][1] - current_burst_edges[0][0])
-				hpi = float((1 - L1_miss_ratio[0][0]) * L1_miss_ratio[0][1] * self.sample_rate) / instr_burst
-				api = float(L1_miss_ratio[0][1] * self.sample_rate) / instr_burst
-			except IndexError:
-				hpi = 0
-				api = 0
-
-			if api == 0:
-				interpolated_L1_hits = 0
-			else:
-				interpolated_L1_hits = hpi  * (current_window[1] - current_window[0])
+		return Window_Interpolation(self.burst_index, self.sample_rate, [current_window], [current_bursts]).hits(0, L1_miss_ratio)
 
-		return interpolated_L1_hits
+	# interpolation weights of all windows at once, to interpolate the miss ratios of many windows without recomputing them
+	def window_interpolation(self, window_bounds, aligned_bursts):
+		return Window_Interpolation(self.burst_index, self.sample_rate, window_bounds, aligned_bursts)
 
 	# Return an approximated first access assuming that it lands in the middle of the landing window
 	def find_takeoff_burst(self, rdist, landing_burst):
@@ -437,17 +464,6 @@ class Statstack:
 		assert(takeoff_burst >= 0)
 		return takeoff_burst
 
-	# Merge rdist_hists from rdist_hists[first] to rdist_hists[last]. Also add optional_counter if not None
-	def merge_counters_range(self, first, last, optional_counter=None):
-		merged_counters = Counter()
-		if optional_counter:
-			merged_counters = optional_counter
-
-		for i in range(first, last + 1):
-			merged_counters.update(self.rdist_hists[i])
-
-		return merged_counters
-
 	def discover_sample_files(self):
 		self.all_samples = []
 
@@ -461,64 +477,98 @@ class Statstack:
 
 		return no_ooo_sample_files
 
+	# the histograms are stored in a Burst_Hists, indexed by the takeoff burst
+	# with a memory cap, they are stored in a Streaming_Burst_Hists that releases the bursts the landing bursts cannot reach anymore
 	def create_rdist_hists_new(self):
-		self.rdist_hists = defaultdict(Counter)
-
-		sample_reader = Stream_Reader(self.all_samples, "STATSTACK", self.compressed)
-		for sample in sample_reader.iter_in_place():
-			if sample.HasField('end'):
-				rdist = sample.end.access_counter - sample.begin.access_counter - 1
-				# should this be begin or end?
-				self.rdist_hists[sample.begin.burst_id][rdist] += 1
-			else:
-				self.rdist_hists[sample.begin.burst_id][sys.maxint] += 1
+		if self.statstack_memory > 0 and self.spill_rdist_hists:
+			spill_root = os.path.join(self.cache_root, "rdist_spill", self.benchmark)
+			if not os.path.exists(spill_root):
+				try:
+					os.makedirs(spill_root)
+				except OSError:
+					# created by a concurrent run
+					pass
+			self.rdist_spill_dir = tempfile.mkdtemp(prefix = self.file_base_name + "_", dir = spill_root)
+		builder = Burst_Hists_Builder(self.rdist_spill_dir, self.statstack_memory)
+
+		if self.use_parallel_build():
+			for rdist_hists in self.parallel_build("new"):
+				builder.add_hists(rdist_hists)
+		elif self.columns_dir != None:
+			for columns in self.open_samples(self.all_samples).iter_columns():
+				count_rdists_new_columns(columns, builder)
+		else:
+			sample_reader = self.open_samples(self.all_samples)
+			count_rdists_new(sample_reader.iter_in_place(), builder)
+
+		if self.statstack_memory > 0:
+			self.rdist_hists = builder.build_streaming(self.statstack_memory, self.rdist_spill_dir)
+			if self.rdist_hists.oversized_blocks > 0:
+				self.progress_printer.print_message("Warning: the reuse distance histograms of %d bursts do not fit in the statstack memory cap of %.1f MB, it is exceeded while they are in memory" % (self.rdist_hists.oversized_blocks, self.statstack_memory / (1024.0 * 1024.0)))
+		else:
+			self.rdist_hists = builder.build()
 
 	def create_rdist_hists_old(self):
 		self.rdist_hists, self.rdist_hists_load, self.rdist_hists_store = defaultdict(Counter), defaultdict(Counter), defaultdict(Counter)
 
-		sample_reader = Stream_Reader(self.all_samples, "STATSTACK", self.compressed)
-		for sample in sample_reader.iter_in_place():
-			if sample.HasField('end'):
-				rdist = sample.end.access_counter - sample.begin.access_counter - 1
-				self.rdist_hists[sample.begin.burst_id][rdist] += 1
-				if sample.end.access_type == 0:
-					self.rdist_hists_load[sample.begin.burst_id][rdist] += 1
-				elif sample.end.access_type == 1:
-					self.rdist_hists_store[sample.begin.burst_id][rdist] += 1
-			else:
-				self.rdist_hists[sample.begin.burst_id][sys.maxint] += 1
-				if sample.begin.access_type == 0:
-					self.rdist_hists_load[sample.begin.burst_id][sys.maxint] += 1
-				elif sample.begin.access_type == 1:
-					self.rdist_hists_store[sample.begin.burst_id][sys.maxint] += 1
+		if self.use_parallel_build():
+			for rdist_hists, rdist_hists_load, rdist_hists_store in self.parallel_build("old"):
+				merge_hists(self.rdist_hists, rdist_hists)
+				merge_hists(self.rdist_hists_load, rdist_hists_load)
+				merge_hists(self.rdist_hists_store, rdist_hists_store)
+		else:
+			sample_reader = self.open_samples(self.all_samples)
+			count_rdists_old(sample_reader.iter_in_place(), self.rdist_hists, self.rdist_hists_load, self.rdist_hists_store)
 
 	def create_rdist_hists_old_PC(self):
 		self.rdist_hists, self.rdist_hists_load, self.rdist_hists_store = defaultdict(), defaultdict(), defaultdict()
 
-		sample_reader = Stream_Reader(self.all_samples, "STATSTACK", self.compressed)
-		for sample in sample_reader.iter_in_place():
-			pc = sample.begin.program_counter
-
-			if not sample.begin.burst_id in self.rdist_hists:
-				self.rdist_hists[sample.begin.burst_id] = defaultdict(Counter)
-				self.rdist_hists_load[sample.begin.burst_id] = defaultdict(Counter)
-				self.rdist_hists_store[sample.begin.burst_id] = defaultdict(Counter)
-
-			if sample.HasField('end'):
-				rdist = sample.end.access_counter - sample.begin.access_counter - 1
-				self.rdist_hists[sample.begin.burst_id][pc][rdist] += 1
-				if sample.end.access_type == 0:
-					self.rdist_hists_load[sample.begin.burst_id][pc][rdist] += 1
-				elif sample.end.access_type == 1:
-					self.rdist_hists_store[sample.begin.burst_id][pc][rdist] += 1
-			else:
-				self.rdist_hists[sample.begin.burst_id][pc][sys.maxint] += 1
-				if sample.begin.access_type == 0:
-					self.rdist_hists_load[sample.begin.burst_id][pc][sys.maxint] += 1
-				elif sample.begin.access_type == 1:
-					self.rdist_hists_store[sample.begin.burst_id][pc][sys.maxint] += 1
+		if self.use_parallel_build():
+			for rdist_hists, rdist_hists_load, rdist_hists_store in self.parallel_build("old_PC"):
+				merge_PC_hists(self.rdist_hists, rdist_hists)
+				merge_PC_hists(self.rdist_hists_load, rdist_hists_load)
+				merge_PC_hists(self.rdist_hists_store, rdist_hists_store)
+		else:
+			sample_reader = self.open_samples(self.all_samples)
+			count_rdists_old_PC(sample_reader.iter_in_place(), self.rdist_hists, self.rdist_hists_load, self.rdist_hists_store)
+
+	# processes in a pool are daemonic and cannot start a pool themselves (e.g. when benchmarks are evaluated in parallel), build serially in that case
+	def use_parallel_build(self):
+		return self.statstack_processes > 1 and len(self.all_samples) > 1 and not multiprocessing.current_process().daemon
+
+	# every sample file is counted by a separate process, the partial histograms are returned in the order of self.all_samples
+	def parallel_build(self, version):
+		process_pool = multiprocessing.Pool(min(self.statstack_processes, len(self.all_samples)))
+		try:
+			partial_hists = process_pool.map(rdist_hists_from_file, [(sample_file, self.compressed, version, self.columns_dir) for sample_file in self.all_samples])
+		finally:
+			process_pool.close()
+			process_pool.join()
+
+		return partial_hists
+
+	# only the new statstack maps bursts that are not cached, streaming burst hists release and reload bursts in this process only, their bursts are always mapped serially
+	def can_map_in_parallel(self):
+		return self.ss_version == "new" and self.statstack_memory == 0 and not self.sd_hists_cached()
+
+	def use_parallel_sdists(self, no_bursts):
+		return no_bursts > 1 and sdist_statstacks.get(self.sdist_key) is self
+
+	def open_samples(self, file_list, message_filter = None):
+		sample_reader = open_sample_reader(file_list, self.compressed, self.read_ahead, self.columns_dir, message_filter)
+		self.sample_readers.append(sample_reader)
+		return sample_reader
+
+	# with a single access type the landing events ignore samples of the other access type, those are skipped by the readers without decoding them
+	def create_landing_events(self):
+		landing_filter, takeoff_filter = None, None
+		if len(self.landing_types) == 1 and (self.columns_dir != None or protobuf_util.PEEK_BEFORE_PARSE):
+			access_types = [0] if self.landing_types[0] == 'r' else [1]
+			landing_filter = Field_Filter(LANDING_ACCESS_TYPE, access_types)
+			takeoff_filter = Field_Filter(TAKEOFF_ACCESS_TYPE, access_types)
+		# samples use the access type of the landing access, traces and dangling samples the one of the takeoff access
+		sample_filter = landing_filter if self.type == "sample" else takeoff_filter
 
-	def create_generators(self):
 		all_samples, all_ooo, all_dangling = [], [], []
 
 		for root,dirs,files in os.walk(self.benchmark_root):
@@ -534,210 +584,46 @@ class Statstack:
 		all_ooo = sorted(all_ooo, key = lambda name: int(name.split(".")[-1]))
 		all_dangling = sorted(all_dangling, key = lambda name: int(name.split(".")[-1]))
 
-		sample_reader = Stream_Reader(all_samples, "STATSTACK", self.compressed)
-		self.gen_sample = sample_reader.iter_in_place()
-
-		# we need to keep the OoO generators seperately because if we append them, they might not be fully sorted
-		self.gens_ooo = []
-		for ooo in all_ooo:
-			sample_reader = Stream_Reader([ooo], "STATSTACK", self.compressed)
-			self.gens_ooo.append(sample_reader.iter_in_place())
+		# every OoO file is sorted on its own, but they might not be fully sorted if we append them, so each one is a separate stream
+		complete = self.open_samples(all_samples, sample_filter)
+		ooo_list = [self.open_samples([ooo], sample_filter) for ooo in all_ooo]
+		dangling = self.open_samples(all_dangling, takeoff_filter)
 
-		sample_reader = Stream_Reader(all_dangling, "STATSTACK", self.compressed)
-		self.gen_dangling = sample_reader.iter_in_place()
+		self.landing_events = Landing_Events(complete, ooo_list, dangling, self.landing_types, takeoff = self.type == "trace")
 
 	def categorize_landing_events(self, extracted_burst_edges, valid_bursts, _type = 'rw'):
-		self.filtered_rdist_hists = defaultdict(Counter)
-		if self.type == "trace":
-			self.per_PC_filtered_rdist_hists = defaultdict()
-
-		if self.type == "trace":
-			if _type == "r":
-				self.memops_to_find = sum([ebe[4] for ebe in extracted_burst_edges])
-			elif _type == "w":
-				self.memops_to_find = sum([ebe[5] for ebe in extracted_burst_edges])
-		else:
-			if _type == "r":
-				self.memops_to_find = sum([ebe[6] for ebe in extracted_burst_edges])
-			elif _type == "w":
-				self.memops_to_find = sum([ebe[7] for ebe in extracted_burst_edges])
-
-		self.events_dangling(valid_bursts, _type = _type)
-
-		# edge case where we only have dangling samples (never seen)
-		if self.memops_to_find != 0:
-			self.events_ooo(valid_bursts, _type = _type)
-
-		# edge case where we only have OoO and dangling samples (never seen)
-		if self.memops_to_find != 0:
-			self.events_complete(valid_bursts, _type = _type)
-
-		if self.memops_to_find > 0:
-			print "Error: number of memops is not 0, something is wrong in the streaming statstack version!"
-			self.debug_printer.save_error_stats("Error: number of memops is not 0, something is wrong in the streaming statstack version!")
-			sys.exit(1)
-
-	def events_dangling(self, valid_bursts, _type = 'rw'):
-		# check the last sample from a previous iteration
-		check_next_dangling = False
-		if self.last_dangling != None:
-			if (_type == 'r' and self.last_dangling.begin.access_type == 0) or (_type == 'w' and self.last_dangling.begin.access_type == 1):
-				burst = self.last_dangling.begin.burst_id
-				if burst in valid_bursts:
-					takeoff_PC = self.last_dangling.begin.program_counter
-
-					self.filtered_rdist_hists[burst][sys.maxint] += 1
-
-					if self.type == "trace":
-						if burst not in self.per_PC_filtered_rdist_hists:
-							self.per_PC_filtered_rdist_hists[burst] = defaultdict(Counter)
-
-						self.per_PC_filtered_rdist_hists[burst][takeoff_PC][sys.maxint] += 1
-
-					self.memops_to_find -= 1
-					check_next_dangling = True
-					self.last_dangling = None
-
-				if burst < valid_bursts[0]:
-					check_next_dangling = True
-
-		if self.last_dangling == None or check_next_dangling:
-			for sample in self.gen_dangling:
-				# If the requested _type is not 'rw', then we keep only the dangling samples whose begin access' access_type is corresponds to _type.
-				# This is not ideal, because the access_type of a dangling sample might not match the access_type of the corresponding cold miss, but we can't really do better than this
-				if (_type == 'r' and sample.begin.access_type == 0) or (_type == 'w' and sample.begin.access_type == 1):
-					burst = sample.begin.burst_id
-					takeoff_PC = sample.begin.program_counter
-
-					if burst > valid_bursts[-1]:
-						self.last_dangling = sample
-						break
-
-					if burst in valid_bursts:
-						self.filtered_rdist_hists[burst][sys.maxint] += 1
-
-						if self.type == "trace":
-							if burst not in self.per_PC_filtered_rdist_hists:
-								self.per_PC_filtered_rdist_hists[burst] = defaultdict(Counter)
-
-							self.per_PC_filtered_rdist_hists[burst][takeoff_PC][sys.maxint] += 1
-
-						self.memops_to_find -= 1
-
-	def events_ooo(self, valid_bursts, _type = 'rw'):
-		# check the last sample from a previous iteration
-		check_next_ooo = False
-		for last in range(0, len(self.last_ooo)):
-			if self.last_ooo[last] != None:
-				if self.type == "sample" and ((_type == 'r' and self.last_ooo[last].end.access_type == 0) or (_type == 'w' and self.last_ooo[last].end.access_type == 1)):
-					landing_burst = self.last_ooo[last].end.burst_id
-					if landing_burst in valid_bursts:
-						rdist = self.last_ooo[last].end.access_counter - self.last_ooo[last].begin.access_counter - 1
-						self.filtered_rdist_hists[landing_burst][rdist] += 1
-
-						self.memops_to_find -= 1
-
-						check_next_ooo = True
-
-					if landing_burst < valid_bursts[0]:
-						check_next_ooo = True
-
-				if self.type == "trace" and ((_type == 'r' and self.last_ooo[last].begin.access_type == 0) or (_type == 'w' and self.last_ooo[last].begin.access_type == 1)):
-					# we take the takeoff pc instead of landing pc because their behaviour should be the same
-					takeoff_burst = self.last_ooo[last].begin.burst_id
-					takeoff_PC = self.last_ooo[last].begin.program_counter
-					if takeoff_burst in valid_bursts:
-						rdist = self.last_ooo[last].end.access_counter - self.last_ooo[last].begin.access_counter - 1
-						self.filtered_rdist_hists[takeoff_burst][rdist] += 1
-
-						if takeoff_burst not in self.per_PC_filtered_rdist_hists:
-							self.per_PC_filtered_rdist_hists[takeoff_burst] = defaultdict(Counter)
-
-						self.per_PC_filtered_rdist_hists[takeoff_burst][takeoff_PC][rdist] += 1
-
-						self.memops_to_find -= 1
-
-						check_next_ooo = True
-
-					if takeoff_burst < valid_bursts[0]:
-						check_next_ooo = True
-
-			if self.last_ooo[last] == None or check_next_ooo:
-				for sample in self.gens_ooo[last]:
-					# If the requested _type is not 'rw', then we keep only the dangling samples whose begin access' access_type is corresponds to _type.
-					# This is not ideal, because the access_type of a dangling sample might not match the access_type of the corresponding cold miss, but we can't really do better than this
-					if self.type == "sample" and ((_type == 'r' and sample.end.access_type == 0) or (_type == 'w' and sample.end.access_type == 1)):
-						landing_burst = sample.end.burst_id
-
-						if landing_burst > valid_bursts[-1]:
-							self.last_ooo[last] = sample
-							break
-
-						if landing_burst in valid_bursts:
-							rdist = sample.end.access_counter - sample.begin.access_counter - 1
-							self.filtered_rdist_hists[landing_burst][rdist] += 1
-
-							self.memops_to_find -= 1
-
-					if self.type == "trace" and ((_type == 'r' and sample.begin.access_type == 0) or (_type == 'w' and sample.begin.access_type == 1)):
-						# we take the takeoff pc instead of landing pc because their behaviour should be the same
-						takeoff_burst = sample.begin.burst_id
-						landing_burst = sample.end.burst_id
-						takeoff_PC = sample.begin.program_counter
-
-						if takeoff_burst > valid_bursts[-1]:
-							self.last_ooo[last] = sample
-							break
-
-						if takeoff_burst in valid_bursts:
-							rdist = sample.end.access_counter - sample.begin.access_counter - 1
-							self.filtered_rdist_hists[takeoff_burst][rdist] += 1
-
-							if takeoff_burst not in self.per_PC_filtered_rdist_hists:
-								self.per_PC_filtered_rdist_hists[takeoff_burst] = defaultdict(Counter)
-
-							self.per_PC_filtered_rdist_hists[takeoff_burst][takeoff_PC][rdist] += 1
-
-							self.memops_to_find -= 1
-
-	def events_complete(self, valid_bursts, _type = 'rw'):
-		for sample in self.gen_sample:
-			if self.type == "sample" and ((_type == 'r' and sample.end.access_type == 0) or (_type == 'w' and sample.end.access_type == 1)):
-				landing_burst = sample.end.burst_id
-
-				if landing_burst in valid_bursts:
-					self.memops_to_find -= 1
-				# fast forward through warmup phases
-				elif self.memops_to_find > 0:
-					continue
-
-				rdist = sample.end.access_counter - sample.begin.access_counter - 1
-				self.filtered_rdist_hists[landing_burst][rdist] += 1
-
-				if self.memops_to_find == 0:
-					break
-
-			if self.type == "trace" and ((_type == 'r' and sample.begin.access_type == 0) or (_type == 'w' and sample.begin.access_type == 1)):
-				# we take the takeoff pc instead of landing pc because their behaviour should be the same
-				takeoff_burst = sample.begin.burst_id
-				landing_burst = sample.end.burst_id
-				takeoff_PC = sample.begin.program_counter
-
-				if takeoff_burst in valid_bursts:
-					self.memops_to_find -= 1
-				elif self.memops_to_find > 0:
-					continue
-
-				rdist = sample.end.access_counter - sample.begin.access_counter - 1
-				self.filtered_rdist_hists[takeoff_burst][rdist] += 1
+		if _type not in self.landing_types:
+			raise ValueError("The landing events of access type %s are not calculated, only those of %s" % (_type, ", ".join(self.landing_types)))
+		if self.landing_events == None:
+			self.create_landing_events()
+
+		# the other access type might have categorized these bursts already
+		pending = self.pending_landing_hists.pop(_type, None)
+		if pending != None and pending[0] == valid_bursts:
+			self.filtered_rdist_hists, self.per_PC_filtered_rdist_hists = pending[1], pending[2]
+			return
+
+		# traces count the takeoff memops of a burst, samples the landing ones
+		memops_to_find = {}
+		for landing_type in self.landing_types:
+			if self.type == "trace":
+				memops_to_find[landing_type] = sum([ebe[4] if landing_type == "r" else ebe[5] for ebe in extracted_burst_edges])
+			else:
+				memops_to_find[landing_type] = sum([ebe[6] if landing_type == "r" else ebe[7] for ebe in extracted_burst_edges])
 
-				if takeoff_burst not in self.per_PC_filtered_rdist_hists:
-					self.per_PC_filtered_rdist_hists[takeoff_burst] = defaultdict(Counter)
+		results = self.landing_events.categorize(valid_bursts, memops_to_find)
 
-				self.per_PC_filtered_rdist_hists[takeoff_burst][takeoff_PC][rdist] += 1
+		for landing_type in self.landing_types:
+			rdist_hists, PC_rdist_hists, sorted_found, complete_found = results[landing_type]
+			if sorted_found + complete_found < memops_to_find[landing_type]:
+				message = "Error: found %d of the %d %s memops of bursts %d-%d in the %s samples of %s (%d dangling or OoO, %d complete), the sample files are incomplete or do not match the burst file!" % (sorted_found + complete_found, memops_to_find[landing_type], "load" if landing_type == "r" else "store", valid_bursts[0], valid_bursts[-1], self.file_base_name, self.benchmark_root, sorted_found, complete_found)
+				self.debug_printer.save_error_stats(message)
+				raise Landing_Events_Error(message)
 
-				if self.memops_to_find == 0:
-					break
+			if landing_type == _type:
+				self.filtered_rdist_hists, self.per_PC_filtered_rdist_hists = rdist_hists, PC_rdist_hists
+			else:
+				self.pending_landing_hists[landing_type] = (valid_bursts, rdist_hists, PC_rdist_hists)
 
 	def calculate_sdist_hists_old(self, bursts, _type='rw'):
 		if _type != 'rw' and _type != 'r' and _type != 'w':
@@ -754,6 +640,54 @@ class Statstack:
 			else:
 				self.sdist_hists_PC[burst_id] = lrumodel.sdist_hist_PC(dict_rdists, _type=_type)
 
+	# the mapping only depends on the reuse distance histograms, which are the same for all Statstack objects that read the same samples
+	def vicinity_mapping(self, first, last):
+		key = (self.benchmark_root, self.file_base_name, first, last)
+		return self.mapping_cache.get(key, lambda: self.compute_vicinity_mapping(first, last))
+
+	def compute_vicinity_mapping(self, first, last):
+		rdists, counts = self.rdist_hists.range_hist(first, last)
+		return dict(zip(rdists.tolist(), lrumodel.lru_sdist_arrays(rdists, counts).tolist()))
+
+	# the sdist of every rdist (sorted) of a landing burst and the number of burst errors, None for rdists that are not in the mapping of their vicinity
+	# an rdist without a takeoff burst is counted as the last mapped sdist, which is CARRIED_SDIST if no rdist of this burst was mapped before it
+	# this only reads the burst hists and edges, so the bursts can be mapped in any order and by any process
+	def burst_sdists(self, burst, rdists):
+		sdists, burst_errors, warnings = [], 0, []
+		sdist = CARRIED_SDIST
+		current_mapping = {}
+		oldest_burst_in_vicinity = None
+		for rdist in rdists:
+			if rdist != sys.maxint:
+				begin_burst = self.find_takeoff_burst(rdist, burst)
+
+				if begin_burst >= 0: #New add
+					# the vicinity is always the range of bursts from oldest_burst_in_vicinity to burst, its histogram is taken from the burst hists at once
+					if oldest_burst_in_vicinity is None or begin_burst < oldest_burst_in_vicinity:
+						oldest_burst_in_vicinity = begin_burst
+						current_mapping = self.vicinity_mapping(oldest_burst_in_vicinity, burst)
+
+					#if rdist is not in current_mapping, it means that we are missing one burst in the vicinity due to the approximation made in find_takeoff_burst()
+					#jump straight to the closest older burst that contains rdist (or to the first burst) instead of adding one burst at a time
+					if oldest_burst_in_vicinity > 0 and rdist not in current_mapping:
+						oldest_burst_in_vicinity = max(self.rdist_hists.last_burst_with(rdist, oldest_burst_in_vicinity), self.rdist_hists.oldest_available_burst())
+						current_mapping = self.vicinity_mapping(oldest_burst_in_vicinity, burst)
+
+					if rdist not in current_mapping:
+						warnings.append("Warning: reuse distance" + str(rdist) + "is not in the current mapping!")
+						sdists.append(None)
+						continue
+
+					sdist = int(round(current_mapping[rdist]))
+				else:
+					burst_errors += 1 #New add
+			else:
+				sdist = sys.maxint
+
+			sdists.append(sdist)
+
+		return sdists, burst_errors, warnings
+
 	def calculate_sdist_hists_new(self, bursts, _type='rw'):
 		if _type != 'rw' and _type != 'r' and _type != 'w':
 			raise ValueError('Unknown access_type %s' % (_type))
@@ -761,65 +695,49 @@ class Statstack:
 		extracted_burst_edges = [self.burst_edges[b] for b in bursts]
 		self.categorize_landing_events(extracted_burst_edges, bursts, _type = _type)
 
-		burst_errors = 0
+		# no rdist reaches back further than the largest one, bursts are calculated in order so older bursts are not needed anymore
+		if self.statstack_memory > 0:
+			self.rdist_hists.release_before(self.find_takeoff_burst(self.rdist_hists.max_rdist, bursts[0]))
+
 		# if we found no landing memory operations of one type (e.g. loads) in a certain burst, this burst won't be added, add it here to make sure the interpolation is correct
 		for burst in bursts:
 			if not burst in self.filtered_rdist_hists:
-				self.filtered_rdist_hists[burst] = Counter()
-				if self.type == "trace":
-					self.per_PC_filtered_rdist_hists[burst] = Counter()
-
-		for burst, hist in self.filtered_rdist_hists.iteritems():
-			current_vicinity = Counter()
-			current_mapping = Counter()
-			oldest_burst_in_vicinity = None
-			self.sdist_hists[burst] = Counter()
-			if self.type == "trace":
-				self.sdist_hists_PC[burst] = Counter()
-			for rdist in sorted(hist.keys()):
-				if rdist != sys.maxint:
-					begin_burst = self.find_takeoff_burst(rdist, burst)
-
-					if begin_burst >= 0: #New add
-						if oldest_burst_in_vicinity is None:
-							current_vicinity = self.merge_counters_range(begin_burst, burst)
-							oldest_burst_in_vicinity = begin_burst
-							current_mapping = lrumodel.lru_sdist(current_vicinity)
-
-						if begin_burst < oldest_burst_in_vicinity:
-							current_vicinity = self.merge_counters_range(begin_burst, oldest_burst_in_vicinity -1, current_vicinity)
-							oldest_burst_in_vicinity = begin_burst
-							current_mapping = lrumodel.lru_sdist(current_vicinity)
-
-						#if rdist is not in current_mapping, it means that we are missing one burst in the vicinity due to the approximation made in find_takeoff_burst()
-						while begin_burst > 0 and rdist not in current_mapping:
-							begin_burst -= 1
-							current_vicinity = self.merge_counters_range(begin_burst, oldest_burst_in_vicinity -1, current_vicinity)
-							oldest_burst_in_vicinity = begin_burst
-							current_mapping = lrumodel.lru_sdist(current_vicinity)
-
-						if rdist not in current_mapping:
-							self.debug_printer.save_log_stats("Warning: reuse distance" + str(rdist) + "is not in the current mapping!")
-							continue
-
-						sdist = int(round(current_mapping[rdist]))
-					else:
-						burst_errors += 1 #New add
-				else:
-					sdist = sys.maxint
+				self.filtered_rdist_hists[burst] = Distance_Hist()
 
-				self.sdist_hists[burst][sdist] += hist[rdist]
+		# every burst is mapped through its own vicinity, the results are combined in the same order whether they were mapped serially or in parallel
+		hists = self.filtered_rdist_hists.items()
+		burst_rdists = [(burst, hist.keys()) for burst, hist in hists]
+		if self.use_parallel_sdists(len(burst_rdists)):
+			mapped = sdist_process_pool.map(burst_sdists_worker, [(self.sdist_key, burst, rdists) for burst, rdists in burst_rdists])
+		else:
+			mapped = [self.burst_sdists(burst, rdists) for burst, rdists in burst_rdists]
+
+		burst_errors, last_sdist = 0, None
+		for (burst, hist), (sdists, errors, warnings) in zip(hists, mapped):
+			for warning in warnings:
+				self.debug_printer.save_log_stats(warning)
+			burst_errors += errors
+
+			# the sdist every rdist of this burst was counted as, the per PC histograms are mapped with it afterwards
+			rdist_sdist = {}
+			sdist_keys, sdist_counts = [], []
+			for (rdist, count), sdist in zip(hist.items(), sdists):
+				if sdist == CARRIED_SDIST:
+					sdist = last_sdist
+				if sdist is None:
+					continue
 
-				if self.type == "trace":
-					# burst might not be in per_PC_filtered_rdist_hists if there were only Dangling samples (no landing samples, thus, no rdist) or no samples at all
-					if burst in self.per_PC_filtered_rdist_hists:
-						# We could keep a list of per-pc histograms that contain rdist instead of doing a linear search through all the per-pc histograms for each rdist
-						for pc, pc_rdist_hist in self.per_PC_filtered_rdist_hists[burst].iteritems():
-							if rdist in pc_rdist_hist:
-								if pc not in self.sdist_hists_PC[burst]:
-									self.sdist_hists_PC[burst][pc] = Counter()
+				sdist_keys.append(sdist)
+				sdist_counts.append(count)
+				rdist_sdist[rdist] = sdist
+				last_sdist = sdist
 
-								self.sdist_hists_PC[burst][pc][sdist] += pc_rdist_hist[rdist]
+			self.sdist_hists[burst] = Distance_Hist(sdist_keys, sdist_counts, precision = self.sd_hist_precision)
+			if self.type == "trace":
+				self.sdist_hists_PC[burst] = {}
+			# burst might not be in per_PC_filtered_rdist_hists if there were only Dangling samples (no landing samples, thus, no rdist) or no samples at all
+			if self.type == "trace" and burst in self.per_PC_filtered_rdist_hists:
+				self.sdist_hists_PC[burst] = self.per_PC_filtered_rdist_hists[burst].sdist_hists(rdist_sdist, self.sd_hist_precision)
 
 		if burst_errors:
 			print "Warning: " + str(burst_errors) + " burst errors encountered!"
@@ -840,27 +758,13 @@ class Statstack:
 			return miss_count / float(ref_count)
 
 	def calculate_sample_miss_ratios(self, cache_sizes, sdist_hists, line_size):
-		miss_ratios = {}
-		cache_sizes = sorted(cache_sizes)
-		for c in cache_sizes:
-			miss_ratios[c] = []
-			loop_keys = sorted(sdist_hists.keys())
-			for k in loop_keys:
-				miss_ratios[c].append((self.compute_miss_ratio(sdist_hists[k], c, line_size), sum(sdist_hists[k].values())))
-
-		return miss_ratios
+		# every histogram is accumulated once and evaluated for all cache sizes at once
+		return sdist_curve.sample_miss_ratios([Sdist_Curve(sdist_hists[k]) for k in sorted(sdist_hists.keys())], cache_sizes, line_size)
 
 	def calculate_PC_miss_ratios(self, cache_sizes, sdist_hists_PC, line_size):
-		miss_ratios_PC = {}
-		cache_sizes = sorted(cache_sizes)
-
-		for c in cache_sizes:
-			miss_ratios_PC[c] = {}
-			burst = sdist_hists_PC.keys()[0]
-			for pc in sdist_hists_PC[burst].keys():
-				miss_ratios_PC[c][pc] = (self.compute_miss_ratio(sdist_hists_PC[burst][pc], c, line_size), sum(sdist_hists_PC[burst][pc].values()))
-
-		return miss_ratios_PC
+		burst = sdist_hists_PC.keys()[0]
+		curves_PC = dict((pc, Sdist_Curve(hist)) for pc, hist in sdist_hists_PC[burst].iteritems())
+		return sdist_curve.PC_miss_ratios(curves_PC, cache_sizes, line_size)
 
 	def print_sample(self, sample):
 		if sample.HasField("end"):
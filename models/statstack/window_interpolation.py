@@ -0,0 +1,107 @@
+#  This file is part of the program: Processor Modeling Tool (PMT).
+#
+#  PMT is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  PMT is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with PMT.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  Authors: Sam Van den Steen, Ghent University
+#  Copyright: 2016, Ghent University
+
+import numpy
+
+# Interpolation of per burst miss ratios over windows. Every burst contributes its misses and accesses per instruction
+# times a weight that only depends on the burst edges and the window bounds: the instructions of the window it covers,
+# plus the integral of the linear interpolation towards the next burst if there is a gap between both. The weights of all
+# windows are computed once, after which the misses and accesses of all windows and cache sizes are weighted sums.
+class Window_Interpolation(object):
+	def __init__(self, burst_index, sample_rate, window_bounds, aligned_bursts):
+		self.sample_rate = sample_rate
+		self.window_bounds = window_bounds
+		self.burst_counts = numpy.array([len(bursts) for bursts in aligned_bursts], dtype = numpy.int64)
+		self.weights = self.compute_weights(burst_index, window_bounds, aligned_bursts)
+		self.window_weights = [weights[:bursts] for weights, bursts in zip(self.weights.tolist(), self.burst_counts.tolist())]
+
+	def compute_weights(self, burst_index, window_bounds, aligned_bursts):
+		windows, slots = len(aligned_bursts), max([1] + [len(bursts) for bursts in aligned_bursts])
+		if windows == 0:
+			return numpy.zeros((0, slots))
+
+		slot = numpy.arange(slots)
+		valid = slot[numpy.newaxis, :] < self.burst_counts[:, numpy.newaxis]
+		ids = numpy.zeros((windows, slots + 1), dtype = numpy.int64)
+		for w, bursts in enumerate(aligned_bursts):
+			ids[w, :len(bursts)] = bursts
+
+		begins, ends = burst_index.begins.astype(numpy.float64), burst_index.ends.astype(numpy.float64)
+		begin, end = begins[ids[:, :-1]], ends[ids[:, :-1]]
+		next_begin, next_end = begins[ids[:, 1:]], ends[ids[:, 1:]]
+		instr, next_instr = end - begin, next_end - next_begin
+		window_begin = numpy.array([float(wb[0]) for wb in window_bounds])[:, numpy.newaxis]
+		window_end = numpy.array([float(wb[1]) for wb in window_bounds])[:, numpy.newaxis]
+
+		# the instruction the interpolation has reached when it gets to a burst, a window stops at the first burst that begins at its end
+		low = numpy.minimum(begin, window_end)
+		low[:, 0] = window_begin[:, 0]
+		reached = numpy.logical_and.accumulate(low != window_end, axis = 1) & valid
+
+		last = slot[numpy.newaxis, :] == (self.burst_counts - 1)[:, numpy.newaxis]
+		middle = valid & ~last
+		single = (self.burst_counts == 1)[:, numpy.newaxis]
+
+		with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+			weights = numpy.maximum(end - low, 0.0) / instr
+
+			# linear interpolation of the per instruction rates over the gap up to the next burst
+			# CHECK THIS: bursts are always next to each other in our current setup, so this cannot be tested
+			gap = next_begin - end
+			x1, x2 = numpy.maximum(end, low), numpy.minimum(next_begin, window_end)
+			gap_weights = (x2 - x1) / instr + (1.0 / next_instr - 1.0 / instr) / gap * (x2 - x1) * ((x2 + x1) / 2.0 - end)
+			weights = numpy.where(middle & (gap != 0), weights + gap_weights, weights)
+
+			weights = numpy.where(last, (window_end - begin) / instr, weights)
+			weights = numpy.where(last & single, (window_end - window_begin) / instr, weights)
+
+		return numpy.where(reached, weights, 0.0)
+
+	# misses (cache sizes x windows) and accesses (windows) of many windows in one pass, from the miss ratios (cache sizes x
+	# windows x bursts) and reference counts (windows x bursts) of the bursts aligned with them, padded with zeros
+	def interpolate(self, windows, ratios, counts):
+		accesses_per_burst = counts * self.sample_rate * self.weights[windows]
+		misses = numpy.sum(ratios * accesses_per_burst[numpy.newaxis, :, :], axis = 2)
+		return misses, numpy.sum(accesses_per_burst, axis = 1)
+
+	# misses and accesses of a window from the per burst (miss ratio, reference count) of a cache size, the same weighted sums
+	# as interpolate() computes, single windows are faster to interpolate without numpy
+	def window_misses(self, window, burst_miss_ratios):
+		misses, accesses = 0.0, 0.0
+		for mr, weight in zip(burst_miss_ratios, self.window_weights[window]):
+			burst_accesses = mr[1] * self.sample_rate * weight
+			misses += mr[0] * burst_accesses
+			accesses += burst_accesses
+		return misses, accesses
+
+	def miss_ratios(self, window, miss_ratios):
+		interpolated_miss_ratios = {}
+		for cs, burst_miss_ratios in miss_ratios.iteritems():
+			misses, accesses = self.window_misses(window, burst_miss_ratios)
+			if accesses == 0:
+				interpolated_miss_ratios[cs] = (0, 0)
+			else:
+				interpolated_miss_ratios[cs] = (misses / accesses, accesses)
+		return interpolated_miss_ratios
+
+	# number of hits of a window from the per burst (miss ratio, reference count) of a cache size
+	def hits(self, window, burst_miss_ratios):
+		misses, accesses = self.window_misses(window, burst_miss_ratios)
+		if accesses == 0:
+			return 0
+		return accesses - misses
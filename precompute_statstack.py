@@ -0,0 +1,211 @@
+#!/usr/bin/python
+
+#  This file is part of the program: Processor Modeling Tool (PMT).
+#
+#  PMT is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  PMT is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with PMT.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  Authors: Sam Van den Steen, Ghent University
+#  Copyright: 2016, Ghent University
+
+import os, getopt, sys, time, signal
+from in_out import Config, Constants, Data_Reader, Progress_Printer, statstack_options
+from models import Statstack, start_sdist_pool, close_statstacks
+from multiprocessing import Pool
+
+#########################################
+#			helper funtions				#
+#########################################
+
+def usage():
+	print "./precompute_statstack.py <-i | --input> <-o | --output> <-b | --benchmarks> [-c | --config] [-p | --parallel] [-a | --argument] [--read-ahead] [--statstack-processes] [--sample-columns] [--compress-sd-hists] [--cache-dir] [--mapping-cache] [--statstack-memory] [--spill-rdist-hists] [--sd-hist-precision]"
+	print "Calculates the stack distance histograms that evaluate_model.py caches (load, store, instr and per PC trace), so the model evaluation of these benchmarks starts with all of them cached"
+	print "The cached histograms are only used by evaluate_model.py runs with the same statstack options"
+	print "-i | --input directory with the profiled benchmarks\n\tDEFAULT: current directory"
+	print "-o | --output directory to put the statstack logs\n\tDEFAULT: current directory"
+	print "-b | --benchmarks benchmarks for which to calculate the stack distance histograms\n\tDEFAULT: all benchmarks in the input directory"
+	print "-c | --config processor configuration\n\tDEFAULT: config/nehalem.cfg"
+	print "-p | --parallel number of benchmarks calculated at the same time\n\tDEFAULT: 1"
+	print "-a | --argument modify specific parameters from the processor configuration file\n\tEXAMPLE: -a L3/size=4194304"
+	statstack_options.usage()
+	print "Example:"
+	print "./precompute_statstack.py -i ~/profiled -o test -b gcc,mcf -p 2 --compress-sd-hists"
+
+def signal_handler():
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def parse_command_line(constants):
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], statstack_options.SHORT_OPTIONS, statstack_options.LONG_OPTIONS)
+	except getopt.GetoptError, e:
+		# print help information and exit:
+		print e
+		usage()
+		sys.exit(1)
+
+	for o, a in opts:
+		if statstack_options.parse_option(constants, o, a):
+			continue
+		if o in ("-h", "--help"):
+			usage()
+			sys.exit(0)
+# Prints a line with the throughput of every finished benchmark and the total throughput at the end
+class Precompute_Report(object):
+	def __init__(self, no_benchmarks):
+		self.no_benchmarks = no_benchmarks
+		self.finished, self.cached, self.empty = 0, 0, 0
+		self.windows, self.bursts, self.sample_bytes = 0, 0, 0
+
+	def add(self, result):
+		benchmark, cached, windows, bursts, sample_bytes, elapsed = result
+		self.finished += 1
+		if cached:
+			self.cached += 1
+			print "[%d/%d] %s: all stack distance histograms were cached already" % (self.finished, self.no_benchmarks, benchmark)
+		elif bursts == 0:
+			self.empty += 1
+			print "[%d/%d] %s: nothing to precompute, %d windows without bursts" % (self.finished, self.no_benchmarks, benchmark, windows)
+		else:
+			self.windows += windows
+			self.bursts += bursts
+			self.sample_bytes += sample_bytes
+			print "[%d/%d] %s: %s" % (self.finished, self.no_benchmarks, benchmark, throughput(windows, bursts, sample_bytes, elapsed))
+		sys.stdout.flush()
+
+	def summary(self, elapsed):
+		print "Precomputed %d of %d benchmarks (%d were cached already, %d had no bursts): %s" % (self.finished - self.cached - self.empty, self.no_benchmarks, self.cached, self.empty, throughput(self.windows, self.bursts, self.sample_bytes, elapsed))
+
+def throughput(windows, bursts, sample_bytes, elapsed):
+	megabytes = sample_bytes / (1024.0 * 1024.0)
+	elapsed = max(elapsed, 1e-6)
+	return "%d windows, %d bursts and %.1f MB of samples in %.1f s (%.1f bursts/s, %.1f MB/s)" % (windows, bursts, megabytes, elapsed, bursts / elapsed, megabytes / elapsed)
+
+#########################################
+#			precompute					#
+#########################################
+
+# calculate the stack distance histograms of every window of a benchmark, the Statstack objects are asked for the same bursts as calculate_model does
+# returns (benchmark, whether every histogram was cached already, windows, bursts, bytes of sample files, seconds)
+def precompute_benchmark(benchmark, constants, config):
+	start = time.time()
+	input_root = os.path.join(constants.input_dir, benchmark)
+	# statstack reads its own sample files, only the metadata and window bounds are needed
+	data_reader = Data_Reader(input_root, config, constants.read_ahead, log_only = True)
+	profiler_metadata, phase_bounds, window_bounds = data_reader.get_log_contents()
+
+	output_root = os.path.join(constants.output_dir, benchmark)
+	if not os.path.exists(output_root):
+		os.makedirs(output_root)
+	progress_printer = Progress_Printer(len(window_bounds), log_file=os.path.join(output_root, "log.out"))
+
+	progress_printer.print_message("Executing preliminary Statstack work:")
+	ss_data = Statstack(constants, benchmark, "data", "new", "sample", "data", profiler_metadata, progress_printer)
+	ss_trace = Statstack(constants, benchmark, "trace", "new", "trace", "data", profiler_metadata, progress_printer)
+	ss_instr = Statstack(constants, benchmark, "instr", "new", "sample", "instr", profiler_metadata, progress_printer)
+	ss_data_aligned_bursts = ss_data.align_bursts_windows(window_bounds)
+	ss_instr_aligned_bursts = ss_instr.align_bursts_windows(window_bounds)
+
+	# the bursts every Statstack maps and the sample files it reads, the data Statstack does loads and stores in the same pass
+	ss_bursts = [(ss_data, set([b for bursts in ss_data_aligned_bursts for b in bursts])), (ss_trace, set(range(len(window_bounds)))), (ss_instr, set([b for bursts in ss_instr_aligned_bursts for b in bursts]))]
+	cached = all([ss.sd_hists_cached() for ss, unique_bursts in ss_bursts])
+	bursts, sample_bytes = 0, 0
+	for ss, unique_bursts in ss_bursts:
+		if not ss.sd_hists_cached():
+			bursts += len(unique_bursts)
+			sample_bytes += sum([os.path.getsize(sample_file) for sample_file in ss.all_samples])
+
+	if bursts > 0:
+		start_sdist_pool(constants, [ss_data, ss_trace, ss_instr])
+		progress_printer.setup_progressbar(message = "\nCalculating stack distance histograms:")
+		for trace_counter in range(len(window_bounds)):
+			progress_printer.print_progress(trace_counter)
+
+			if not ss_data.sd_hists_cached():
+				ss_data.get_sd_hists(_type='r', bursts = ss_data_aligned_bursts[trace_counter])
+				ss_data.get_sd_hists(_type='w', bursts = ss_data_aligned_bursts[trace_counter])
+			if not ss_trace.sd_hists_cached():
+				ss_trace.get_sd_hists(_type='r', bursts = [trace_counter])
+			if not ss_instr.sd_hists_cached():
+				ss_instr.get_sd_hists(_type='r', bursts = ss_instr_aligned_bursts[trace_counter])
+
+	# all windows were processed, the stack distance histograms written by statstack are complete now
+	close_statstacks([ss_data, ss_trace, ss_instr])
+
+	elapsed = time.time() - start
+	if cached:
+		progress_printer.print_message("All stack distance histograms were cached already")
+	elif bursts == 0:
+		progress_printer.print_message("Nothing to precompute, %d windows without bursts" % (len(window_bounds)))
+	else:
+		progress_printer.print_message(throughput(len(window_bounds), bursts, sample_bytes, elapsed))
+	progress_printer.close_log_file()
+
+	return benchmark, cached, len(window_bounds), bursts, sample_bytes, elapsed
+
+def main():
+	# Make sure that we are operating in the directory of this file.
+	os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+	constants = Constants()
+	constants.top_level_dir = os.getcwd()
+	parse_command_line(constants)
+
+	# the output directory only holds logs, existing logs are overwritten
+	if not os.path.exists(constants.output_dir):
+		os.makedirs(constants.output_dir)
+
+	config = Config(constants.processor_config, constants.overwrite_config_parameters, constants.output_dir)
+
+	# no benchmarks were supplied, use all subdirectories in the input directory
+	if constants.benchmarks == []:
+		constants.benchmarks = statstack_options.find_benchmarks(constants.input_dir)
+
+	print "Precomputing the stack distance histograms of %d benchmarks, %d at a time" % (len(constants.benchmarks), constants.parallel)
+	sys.stdout.flush()
+	report = Precompute_Report(len(constants.benchmarks))
+	start = time.time()
+
+	# NON-PARALLEL
+	if constants.parallel == 1:
+		for benchmark in constants.benchmarks:
+			report.add(precompute_benchmark(benchmark, constants, config))
+	# PARALLEL
+	else:
+		process_pool = Pool(constants.parallel, signal_handler)
+		# the report is updated by the result handler of the pool, one benchmark at a time
+		results = [process_pool.apply_async(precompute_benchmark, args=(benchmark, constants, config), callback=report.add) for benchmark in constants.benchmarks]
+
+		try:
+			while not all([result.ready() for result in results]):
+				time.sleep(1)
+		except KeyboardInterrupt:
+			# forced termination, sd hist files are only marked complete when a benchmark finishes, so partial ones are never used
+			print "\nKilling processes!"
+
+			process_pool.terminate()
+			process_pool.join()
+
+			sys.exit(1)
+		else:
+			# normal termination
+			process_pool.close()
+			process_pool.join()
+
+		# raise the error of a benchmark that failed
+		for result in results:
+			result.get()
+
+	report.summary(time.time() - start)
+
+if __name__ == '__main__':
+	main()